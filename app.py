@@ -2,21 +2,45 @@
 import uvicorn 
 import uuid
 import re
+import time
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile
 from typing import List
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from config.logging import fastapi_app_logger
-from assistant_core.retriever_prompt import ask_assistant
-from assistant_core.doc_handler import load_documents_from_upload
+from config.logging import fastapi_app_logger, request_id
+from assistant_core.retriever_prompt import ask_assistant, ask_assistant_stream, get_answer_cache, get_pipeline, warm_up, conversation_memory
+from assistant_core.streaming import sse_event
+from assistant_core.web_search import get_web_search
+from assistant_core.embedding_vec import export_session_embeddings, cache_embeddings
+from assistant_core.session_store import SessionStore
+from assistant_core.upload_jobs import UploadJobQueue, upload_job_workers
+from assistant_core.workers import run_io, iterate_io, shutdown_workers
+from assistant_core.metrics import metrics, flatten_stats
+from contextlib import asynccontextmanager
 import os
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    upload_jobs.start()
+    #build the models and clients before serving, instead of on the first request
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "1":
+        try:
+            await run_io("query", warm_up)
+        except Exception as e:
+            fastapi_app_logger.error(f"Warm-up failed, models will be loaded on first use: {e}")
+    yield
+    #stop the upload jobs and the parsing/query worker pools when the server shuts down
+    await upload_jobs.stop()
+    shutdown_workers()
+
 #creating the fastapi instance
 app = FastAPI(title="AI-Powered Assistant for Accounting Students",
              description="An AI-powered assistant to assist accounting students with Financial Accounting",
-             version="1.0.0")
+             version="1.0.0",
+             lifespan=lifespan)
 
 #allowing CORS for all origins
 app.add_middleware(
@@ -27,7 +51,43 @@ app.add_middleware(
     allow_headers = ["*"]
 )
 
-user_uploaded_docs = {}
+#request id and metrics for every request
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """
+    Tag the request with an id (the client's X-Request-ID if sent), which every log line written
+    while serving it carries, and record its latency and status by route.
+    """
+    rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    token = request_id.set(rid)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        #route templates, not raw paths, so session ids do not create new series
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.observe("assistant_http_request_seconds", time.perf_counter() - start, route=path)
+        metrics.inc("assistant_http_requests_total", route=path, method=request.method, status=status)
+        request_id.reset(token)
+
+#parsed uploads per session: idle TTL, global memory budget and optional spill to disk
+user_uploaded_docs = SessionStore(
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+    max_bytes = int(os.getenv("SESSION_DOCS_MAX_MB", "256")) * 1024 * 1024,
+    spill_dir = os.getenv("SESSION_SPILL_DIR") or None,
+    export_embeddings = export_session_embeddings,
+    import_embeddings = cache_embeddings
+)
+
+#background queue that parses and embeds uploads
+upload_jobs = UploadJobQueue(user_uploaded_docs,
+                             workers = upload_job_workers,
+                             ttl = float(os.getenv("SESSION_TTL_SECONDS", "3600")))
 
 #getting the health status of the API 
 @app.get("/health")
@@ -36,39 +96,72 @@ async def health_check():
     Health check point to verify if the API is running smoothly
     """
     return JSONResponse(
-        content={"status": "ok", "message": "Welcome to the AI Assistant API 🚀"}, 
+        content={"status": "ok", "message": "Welcome to the AI Assistant API 🚀",
+                 "ready": get_pipeline.peek() is not None,
+                 "sessions": await run_io("session", user_uploaded_docs.stats),
+                 "answer_cache": get_answer_cache.peek().stats() if get_answer_cache.peek() else None,
+                 "web_search": get_web_search.peek().stats() if get_web_search.peek() else None,
+                 "conversations": conversation_memory.stats()}, 
         status_code=200)
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: stage latency histograms, request counts, cache and payload metrics.
+    """
+    gauges = {}
+    gauges.update(flatten_stats("assistant_sessions", await run_io("session", user_uploaded_docs.stats)))
+    gauges.update(flatten_stats("assistant_conversations", conversation_memory.stats()))
+    if get_answer_cache.peek():
+        gauges.update(flatten_stats("assistant_answer_cache", get_answer_cache.peek().stats()))
+    if get_web_search.peek():
+        gauges.update(flatten_stats("assistant_web_search", get_web_search.peek().stats()))
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
 @app.post("/upload")
 async def upload_documents(files: List[UploadFile] = File(...)):
     """
     Endpoint to handle document uploads from users.
+    The files are queued for background processing and the session id is returned right away;
+    poll /upload/{session_id}/status for progress. Queries can use the files that are ready so far.
     """
-    # Placeholder implementation
     try:
-        #parse uploaded files from the request 
-        docs = load_documents_from_upload(files)
-
-        if not docs:
+        #read the files now, the upload objects are closed once this request returns
+        payloads = [(file.filename, await file.read()) for file in files]
+        if not payloads:
             fastapi_app_logger.error("No valid documents were uploaded.")
             raise HTTPException(status_code=400, detail="No valid documents were uploaded.")
         session_id = str(uuid.uuid4())
-        user_uploaded_docs[session_id] = docs
-        fastapi_app_logger.info(f"Successfully processed {len(docs)} documents from upload.")
+        metrics.observe("assistant_payload_bytes", sum(len(content) for _, content in payloads), kind="upload_request")
+        upload_jobs.submit(session_id, payloads)
+        fastapi_app_logger.info(f"Queued {len(payloads)} files for processing in session {session_id}.")
 
         return JSONResponse(
             content = {
-                "status": "success", 
-                "message": f"Successfully uploaded and processed {len(docs)} documents.",
+                "status": "accepted", 
+                "message": f"Processing {len(payloads)} documents.",
                 "session_id": session_id
             },
-            status_code=200
+            status_code=202
         )
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         fastapi_app_logger.error(f"Error processing uploaded documents: {e}")
         raise HTTPException(status_code=500, detail="Error processing uploaded documents.")
 
 
+@app.get("/upload/{session_id}/status")
+async def upload_status(session_id: str):
+    """
+    Endpoint reporting the progress of an upload: per-file pages parsed, pages OCR'd and chunks embedded.
+    """
+    job = upload_jobs.get(session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown upload session.")
+    return JSONResponse(content=job.to_dict(), status_code=200)
+
+
 
 @app.post("/query")
 async def query_chatbot(request:Request):
@@ -80,21 +173,52 @@ async def query_chatbot(request:Request):
         query = data.get("query")
         session_id = data.get("session_id")
         course = data.get("course")  #optional course filter
-        chat_history = data.get("history", [])  #optional chat history
+        #the server keeps the conversation; clients that do not send a conversation id may still send the history
+        conversation_id = data.get("conversation_id")
+        chat_history = conversation_memory.history(conversation_id) if conversation_id else data.get("history", [])
 
         if not query:
             fastapi_app_logger.error("Query parameter is missing")
             raise HTTPException(status_code=400, detail="Query parameter is required")
+        metrics.observe("assistant_payload_bytes", len(query), kind="question_chars")
         
         #retrieving user-uploaded documents for the session if available
-        uploaded_docs = user_uploaded_docs.get(session_id, []) if session_id else []
+        #may load a spilled session back from disk, so it runs off the event loop
+        uploaded_docs = await run_io("session", user_uploaded_docs.get, session_id, [])
+
+        #streaming mode: answer tokens are sent as server-sent events while they are generated
+        if data.get("stream") or "text/event-stream" in request.headers.get("accept", ""):
+            async def event_stream():
+                answer = []
+                async for token in iterate_io(
+                    "query",
+                    ask_assistant_stream,
+                    question=query,
+                    course=course,
+                    chat_history=chat_history,
+                    uploaded_docs=uploaded_docs,
+                    session_id=session_id
+                ):
+                    answer.append(token)
+                    yield sse_event({"token": token})
+                yield sse_event({}, event="done")
+                metrics.observe("assistant_payload_bytes", sum(len(t) for t in answer), kind="answer_chars")
+                if conversation_id:
+                    conversation_memory.append(conversation_id, query, "".join(answer))
+
+            #the generator runs in the io pool under the same QUERY_CONCURRENCY limit as plain queries
+            return StreamingResponse(event_stream(), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
         #calling the assistant function to get the response 
-        response = ask_assistant(
+        response = await run_io(
+            "query",
+            ask_assistant,
             question=query, 
             course=course, 
             chat_history=chat_history,
-            uploaded_docs=uploaded_docs
+            uploaded_docs=uploaded_docs,
+            session_id=session_id
         )
         fastapi_app_logger.info(f"Received response from the assistant: {response}")
         
@@ -104,6 +228,9 @@ async def query_chatbot(request:Request):
         
         #return cleaned up response without thinking steps 
         clean_response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
+        metrics.observe("assistant_payload_bytes", len(clean_response), kind="answer_chars")
+        if conversation_id:
+            conversation_memory.append(conversation_id, query, clean_response)
         
         #returning the response as plain text
         return PlainTextResponse(content=clean_response, status_code=200)
@@ -0,0 +1,147 @@
+#semantic cache of answers to (nearly) repeated student questions
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config.logging import retriever_prompt_logger
+
+
+class SemanticAnswerCache:
+    """
+    Returns a stored answer when a new question is close enough in embedding space to
+    one that was already answered, skipping retrieval and generation entirely.
+
+    Entries are scoped: questions only match answers given for the same course filter,
+    and questions from a session with uploads only match answers given in that same
+    session (its answer depended on its own documents). Inside a scope the normalized
+    question vectors form a float32 matrix searched with a single matrix-vector product,
+    which is exact and fast at the size this cache is bounded to.
+
+    Args:
+        embedder: Embedding model with embed_query (the cached MiniLM model).
+        threshold (float): Minimum cosine similarity for a hit.
+        ttl (float): Seconds an answer stays valid.
+        max_entries (int): Total answers kept, least recently used evicted first.
+        manifest_path (str): The indexing manifest; when the indexing job rewrites it
+            the corpus changed and every cached answer is dropped.
+    """
+
+    def __init__(self, embedder, threshold:float = 0.92, ttl:float = 86400, max_entries:int = 5000,
+                 manifest_path:str = None):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.manifest_path = manifest_path
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._scopes: Dict[Tuple, dict] = {}  #scope -> {"ids": [...], "matrix": np.ndarray or None}
+        self._next_id = 0
+        self._corpus_version = self._read_corpus_version()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(course:str = None, session_id:str = None, has_uploads:bool = False) -> Tuple:
+        return (course or "", session_id if has_uploads else None)
+
+    def _read_corpus_version(self):
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            return os.path.getmtime(self.manifest_path)
+        return None
+
+    def _vector(self, question:str) -> np.ndarray:
+        vector = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, question:str, scope:Tuple) -> Optional[str]:
+        """
+        Return the cached answer of the most similar earlier question in the scope, if it is similar enough.
+        """
+        start = time.perf_counter()
+        vector = self._vector(question)
+        with self._lock:
+            self._check_corpus_version()
+            self._expire()
+            best_id, best_score = self._search(scope, vector)
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.latency_saved += max(0.0, entry["latency"] - (time.perf_counter() - start))
+        retriever_prompt_logger.info(f"Answer cache hit (similarity {best_score:.3f}) for question: {question}")
+        return entry["answer"]
+
+    def store(self, question:str, scope:Tuple, answer:str, latency:float):
+        """
+        Remember the answer to a question together with how long it took to produce.
+        """
+        vector = self._vector(question)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {"scope": scope, "vector": vector, "answer": answer,
+                                       "created": time.time(), "latency": latency}
+            group = self._scopes.setdefault(scope, {"ids": [], "matrix": None})
+            group["ids"].append(entry_id)
+            group["matrix"] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        """
+        Drop every cached answer, called when the corpus is re-indexed.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+        retriever_prompt_logger.info("Answer cache invalidated.")
+
+    def _check_corpus_version(self):
+        version = self._read_corpus_version()
+        if version != self._corpus_version:
+            self._corpus_version = version
+            self._entries.clear()
+            self._scopes.clear()
+            retriever_prompt_logger.info("Corpus was re-indexed, answer cache cleared.")
+
+    def _search(self, scope:Tuple, vector:np.ndarray):
+        group = self._scopes.get(scope)
+        if not group or not group["ids"]:
+            return None, 0.0
+        if group["matrix"] is None:
+            group["matrix"] = np.stack([self._entries[i]["vector"] for i in group["ids"]])
+        scores = group["matrix"] @ vector
+        best = int(np.argmax(scores))
+        return group["ids"][best], float(scores[best])
+
+    def _expire(self):
+        now = time.time()
+        for entry_id in [i for i, e in self._entries.items() if now - e["created"] > self.ttl]:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id:int):
+        entry = self._entries.pop(entry_id)
+        group = self._scopes[entry["scope"]]
+        group["ids"].remove(entry_id)
+        group["matrix"] = None
+        if not group["ids"]:
+            del self._scopes[entry["scope"]]
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit rate and the generation time saved by cache hits.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "entries": len(self._entries),
+        }
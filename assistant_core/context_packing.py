@@ -0,0 +1,172 @@
+#context assembly before the answer chain: rerank, drop near-duplicates, merge neighbours, fit a token budget
+from typing import List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from assistant_core.dedup import minhash_signature, signature_similarity
+from assistant_core.conversation_memory import estimate_tokens
+from config.logging import retriever_prompt_logger
+
+
+def merge_overlapping(first:str, second:str, min_overlap:int = 20) -> Optional[str]:
+    """
+    Join two consecutive chunks of one page if the end of `first` is the start of `second`
+    (the splitter's overlap), keeping the shared text once.
+
+    Returns:
+        str: The merged text, or None if the chunks do not overlap.
+    """
+    probe = second[:min_overlap]
+    if len(probe) < min_overlap:
+        return None
+    #the overlap is at most a few hundred characters, only the tail of the first chunk is searched
+    start = first.rfind(probe, max(0, len(first) - 4 * len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.rfind(probe, 0, start)
+    return None
+
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a small sentence-transformers cross-encoder on the CPU.
+
+    Args:
+        model_name (str): Hugging Face name of the cross-encoder.
+        batch_size (int): Pairs scored per forward pass.
+    """
+
+    def __init__(self, model_name:str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size:int = 16):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def rank(self, query:str, docs:List[Document]) -> List[int]:
+        scores = self.model.predict([(query, d.page_content) for d in docs], batch_size=self.batch_size)
+        return [int(i) for i in np.argsort(-np.asarray(scores), kind="stable")]
+
+
+class ContextPacker:
+    """
+    Turns the fused retrieval results into the context of the answer prompt. Candidates are
+    ordered by a cross-encoder if one is given, otherwise by MMR over their embeddings (relevant
+    but not redundant first). Near-duplicates of a better candidate are dropped, and candidates
+    are then added in that order until `max_tokens` is used up; the best candidate is always
+    kept, cut to the budget if it is longer. Chunks of the same source and page are merged into
+    one passage, and the splitter's overlap is kept only once.
+
+    Args:
+        embedding: Embedding model used for MMR (not needed with a reranker).
+        max_tokens (int): Token budget of the packed context.
+        reranker: Object with rank(query, docs) -> indices best first, e.g. CrossEncoderReranker.
+        mmr_lambda (float): MMR trade-off, 1.0 ranks by relevance only.
+        duplicate_threshold (float): Estimated Jaccard similarity above which a candidate is dropped.
+        tokenizer: Hugging Face (fast) tokenizer the budget is counted in, or None to estimate tokens.
+    """
+
+    def __init__(self, embedding = None, max_tokens:int = 2000, reranker = None, mmr_lambda:float = 0.7,
+                 duplicate_threshold:float = 0.8, tokenizer = None):
+        if embedding is None and reranker is None:
+            raise ValueError("ContextPacker needs an embedding model for MMR or a reranker.")
+        self.embedding = embedding
+        self.max_tokens = max_tokens
+        self.reranker = reranker
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.tokenizer = tokenizer
+
+    def count_tokens(self, text:str) -> int:
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False, verbose=False))
+
+    def truncate(self, text:str, max_tokens:int) -> str:
+        """
+        The longest prefix of `text` that fits in `max_tokens`, cut at a token boundary.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        #offsets map tokens back to the original text, decoding would lose its case and spacing
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                 verbose=False)["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]]
+
+    def rank(self, query:str, docs:List[Document]) -> List[int]:
+        """
+        Indices of the candidates, best first.
+        """
+        if self.reranker is not None:
+            return self.reranker.rank(query, docs)
+        query_vector = np.array(self.embedding.embed_query(query))
+        doc_vectors = self.embedding.embed_documents([d.page_content for d in docs])
+        ranked = maximal_marginal_relevance(query_vector, doc_vectors, lambda_mult=self.mmr_lambda, k=len(docs))
+        #MMR returns fewer indices when vectors repeat, the rest keep their retrieval order
+        seen = set(ranked)
+        return ranked + [i for i in range(len(docs)) if i not in seen]
+
+    def pack(self, query:str, docs:List[Document]) -> List[Document]:
+        """
+        Select, merge and order the documents that go into the prompt.
+
+        Args:
+            query (str): The standalone question used for retrieval.
+            docs (list): Fused retrieval results.
+
+        Returns:
+            list: Packed documents, most relevant first, within the token budget.
+        """
+        if not docs:
+            return docs
+        order = self.rank(query, docs) if len(docs) > 1 else [0]
+
+        selected, signatures, used = [], [], 0
+        dropped_duplicates = 0
+        costs = [self.count_tokens(d.page_content) for d in docs]
+        for i in order:
+            doc = docs[i]
+            signature = minhash_signature(doc.page_content)
+            if any(signature_similarity(signature, s) >= self.duplicate_threshold for s in signatures):
+                dropped_duplicates += 1
+                continue
+            cost = costs[i]
+            if used + cost > self.max_tokens:
+                if selected:
+                    #a smaller candidate further down may still fit
+                    continue
+                #the best candidate is never dropped for its length, it is cut to the budget instead
+                doc = Document(id=doc.id, page_content=self.truncate(doc.page_content, self.max_tokens),
+                               metadata=dict(doc.metadata))
+                cost = self.count_tokens(doc.page_content)
+            selected.append(doc)
+            signatures.append(signature)
+            used += cost
+
+        packed = self.merge_neighbours(selected)
+        retriever_prompt_logger.info(
+            f"Packed context: {len(docs)} candidates ({sum(costs)} tokens) -> {len(packed)} passages "
+            f"({used} tokens), {dropped_duplicates} near-duplicates dropped.")
+        return packed
+
+    @staticmethod
+    def merge_neighbours(docs:List[Document]) -> List[Document]:
+        """
+        Merge documents of the same source and page into one passage at the position of the best one.
+        """
+        passages, positions = [], {}
+        for doc in docs:
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            if key[0] is None or key not in positions:
+                positions[key] = len(passages)
+                passages.append(Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata)))
+                continue
+            passage = passages[positions[key]]
+            text = (merge_overlapping(passage.page_content, doc.page_content)
+                    or merge_overlapping(doc.page_content, passage.page_content)
+                    or passage.page_content + "\n\n" + doc.page_content)
+            passage.page_content = text
+        return passages
@@ -0,0 +1,133 @@
+#server-side conversation memory: sliding window of recent turns plus a rolling summary
+import math
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from config.logging import retriever_prompt_logger
+
+
+def estimate_tokens(text:str) -> int:
+    """
+    Rough token count of English text (about four characters per token), good enough for budgeting.
+    """
+    return math.ceil(len(text) / 4)
+
+
+class Conversation:
+    def __init__(self):
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+        self.summarizing = False
+
+
+class ConversationMemory:
+    """
+    Keeps each conversation on the server so clients only send the new question. The last
+    `window_turns` turns (question/answer pairs) are kept verbatim; older turns are folded into a running summary by
+    `summarize(summary, turns)` in a background thread, so the answer is never delayed by it.
+    The history handed to the model (summary first, then the newest turns that fit) never
+    exceeds `max_tokens`, which keeps the cost of a turn flat however long the conversation gets.
+
+    Args:
+        summarize (callable): Takes the current summary and the turns to fold in, returns the new summary.
+        window_turns (int): Recent question/answer turns kept verbatim.
+        max_tokens (int): Token budget of the history passed to the model.
+        ttl (float): Seconds an idle conversation is kept.
+        max_conversations (int): Conversations kept, least recently used dropped first.
+    """
+
+    def __init__(self, summarize:Callable[[str, List[Tuple[str, str]]], str], window_turns:int = 3,
+                 max_tokens:int = 1500, ttl:float = 86400, max_conversations:int = 10000):
+        self.summarize = summarize
+        self.window_turns = window_turns
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation-summary")
+
+    def _get(self, conversation_id:str, create:bool = False) -> Conversation:
+        with self._lock:
+            now = time.monotonic()
+            for cid in [c for c, conv in self._conversations.items() if now - conv.last_access > self.ttl]:
+                del self._conversations[cid]
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None and create:
+                conversation = self._conversations[conversation_id] = Conversation()
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+            if conversation is not None:
+                conversation.last_access = now
+                self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def history(self, conversation_id:str) -> List[Tuple[str, str]]:
+        """
+        The (role, content) history to give the model for the next question, within the token budget.
+        """
+        conversation = self._get(conversation_id)
+        if conversation is None:
+            return []
+        with conversation.lock:
+            summary, turns = conversation.summary, list(conversation.turns)
+        budget = self.max_tokens
+        history = []
+        if summary:
+            #the summary may use at most half of the budget, the rest goes to the newest turns
+            summary = summary[:budget * 2]
+            history.append(("summary", summary))
+            budget -= estimate_tokens(summary)
+        recent = []
+        for role, content in reversed(turns):
+            cost = estimate_tokens(content)
+            if cost > budget:
+                break
+            recent.append((role, content))
+            budget -= cost
+        return history + list(reversed(recent))
+
+    def append(self, conversation_id:str, question:str, answer:str):
+        """
+        Record a finished question/answer turn, folding overflowing turns into the summary in the background.
+        """
+        conversation = self._get(conversation_id, create=True)
+        with conversation.lock:
+            conversation.turns += [("user", question), ("assistant", answer)]
+            #turns holds one (role, content) message per entry, two per question/answer turn
+            if len(conversation.turns) <= 2 * self.window_turns or conversation.summarizing:
+                return
+            conversation.summarizing = True
+        self._executor.submit(self._compact, conversation_id, conversation)
+
+    def _compact(self, conversation_id:str, conversation:Conversation):
+        try:
+            with conversation.lock:
+                overflow = conversation.turns[:max(0, len(conversation.turns) - 2 * self.window_turns)]
+                summary = conversation.summary
+            new_summary = self.summarize(summary, overflow)
+            with conversation.lock:
+                #turns that arrived meanwhile stay in the window, only the folded ones are dropped
+                conversation.turns = conversation.turns[len(overflow):]
+                conversation.summary = new_summary
+            retriever_prompt_logger.info(f"Folded {len(overflow) // 2} turns of conversation {conversation_id} into its summary.")
+        except Exception as e:
+            #keep the turns; the next append retries, and history() enforces the budget meanwhile
+            retriever_prompt_logger.error(f"Error summarizing conversation {conversation_id}: {e}")
+        finally:
+            conversation.summarizing = False
+
+    def clear(self, conversation_id:str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "summarized": sum(1 for c in self._conversations.values() if c.summary),
+            }
@@ -0,0 +1,199 @@
+#near-duplicate chunk detection for the indexing job (MinHash signatures + LSH banding)
+import re
+import json
+import sqlite3
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+
+word_pattern = re.compile(r"\w+")
+
+#MinHash parameters: 64 permutations split into 8 LSH bands of 8 rows, so pairs above ~0.77
+#Jaccard similarity usually share a band and are then compared on the full signature
+num_perm = 64
+bands = 8
+rows_per_band = num_perm // bands
+_mersenne_prime = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+_perm_a = _rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+_perm_b = _rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+
+
+def minhash_signature(text:str, shingle_size:int = 5) -> np.ndarray:
+    """
+    MinHash signature of a text over its word shingles, case and punctuation insensitive.
+
+    Args:
+        text (str): The chunk text.
+        shingle_size (int): Words per shingle.
+
+    Returns:
+        np.ndarray: num_perm uint32 values.
+    """
+    words = word_pattern.findall(text.lower())
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (hashes[:, None] * _perm_a + _perm_b) % _mersenne_prime
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def signature_similarity(a:np.ndarray, b:np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the texts behind two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+class DedupIndex:
+    """
+    Registry of the canonical chunks in the vector index and of every file chunk that was
+    merged into one of them. A chunk whose MinHash signature is at least `threshold` similar
+    to a canonical chunk of the same course and subject is not embedded; its file is added
+    to the canonical chunk's sources instead. Duplicates are only looked for within one
+    subject, so course filters keep finding every passage.
+
+    Tables: canonical (id, scope, signature, text, metadata with its sources), bands (LSH
+    buckets of the canonical signatures) and members (file, chunk id -> canonical id).
+
+    Args:
+        path (str): Path of the SQLite file.
+        threshold (float): Minimum estimated Jaccard similarity of a near-duplicate.
+    """
+
+    def __init__(self, path:str, threshold:float = 0.85):
+        self.threshold = threshold
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS canonical (id TEXT PRIMARY KEY, scope TEXT NOT NULL,
+                signature BLOB NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS bands (scope TEXT NOT NULL, band INTEGER NOT NULL,
+                hash BLOB NOT NULL, id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (scope, band, hash);
+            CREATE INDEX IF NOT EXISTS bands_id ON bands (id);
+            CREATE TABLE IF NOT EXISTS members (file TEXT NOT NULL, chunk_id TEXT NOT NULL,
+                canonical_id TEXT NOT NULL, PRIMARY KEY (file, chunk_id));
+            CREATE INDEX IF NOT EXISTS members_canonical ON members (canonical_id);
+        """)
+
+    @staticmethod
+    def scope(metadata:dict) -> str:
+        return f"{metadata.get('course')}/{metadata.get('subject')}"
+
+    def find(self, signature:np.ndarray, scope:str) -> Optional[str]:
+        """
+        Id of the most similar canonical chunk in the scope, if it is similar enough.
+        """
+        conditions = " OR ".join(["(band = ? AND hash = ?)"] * bands)
+        params = [scope]
+        for band in range(bands):
+            params += [band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes()]
+        candidates = self._db.execute(
+            f"SELECT DISTINCT c.id, c.signature FROM bands b JOIN canonical c ON c.id = b.id "
+            f"WHERE b.scope = ? AND ({conditions})", params).fetchall()
+        best_id, best_score = None, 0.0
+        for canonical_id, blob in candidates:
+            score = signature_similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score > best_score:
+                best_id, best_score = canonical_id, score
+        return best_id if best_score >= self.threshold else None
+
+    def register(self, file_path:str, chunk:Document) -> Tuple[str, bool]:
+        """
+        Record a chunk of a file and decide whether it needs its own vector.
+
+        Returns:
+            tuple: (canonical id, True if the chunk is canonical and must be embedded and upserted).
+        """
+        row = self._db.execute("SELECT canonical_id FROM members WHERE file = ? AND chunk_id = ?",
+                               (file_path, chunk.id)).fetchone()
+        if row:
+            return row[0], row[0] == chunk.id
+
+        scope = self.scope(chunk.metadata)
+        signature = minhash_signature(chunk.page_content)
+        canonical_id = self.find(signature, scope)
+        if canonical_id is None:
+            canonical_id = chunk.id
+            metadata = dict(chunk.metadata, sources=[file_path])
+            self._db.execute("INSERT OR REPLACE INTO canonical (id, scope, signature, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                             (chunk.id, scope, signature.tobytes(), chunk.page_content, json.dumps(metadata)))
+            self._db.executemany("INSERT INTO bands (scope, band, hash, id) VALUES (?, ?, ?, ?)",
+                                 [(scope, band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes(), chunk.id)
+                                  for band in range(bands)])
+        else:
+            self._add_source(canonical_id, file_path)
+        self._db.execute("INSERT INTO members (file, chunk_id, canonical_id) VALUES (?, ?, ?)",
+                         (file_path, chunk.id, canonical_id))
+        return canonical_id, canonical_id == chunk.id
+
+    def release(self, file_path:str, chunk_ids:List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Forget chunks of a file that were changed or removed.
+
+        Returns:
+            tuple: (vector ids to delete because nothing refers to them any more,
+            canonical ids still in use whose sources changed and must be re-upserted).
+            Chunks indexed before deduplication existed are returned for deletion as they are.
+        """
+        to_delete, to_update = [], set()
+        for chunk_id in chunk_ids:
+            row = self._db.execute("SELECT canonical_id FROM members WHERE file = ? AND chunk_id = ?",
+                                   (file_path, chunk_id)).fetchone()
+            if row is None:
+                to_delete.append(chunk_id)
+                continue
+            canonical_id = row[0]
+            self._db.execute("DELETE FROM members WHERE file = ? AND chunk_id = ?", (file_path, chunk_id))
+            remaining = self._db.execute("SELECT file FROM members WHERE canonical_id = ?", (canonical_id,)).fetchall()
+            if not remaining:
+                self._db.execute("DELETE FROM canonical WHERE id = ?", (canonical_id,))
+                self._db.execute("DELETE FROM bands WHERE id = ?", (canonical_id,))
+                to_delete.append(canonical_id)
+                to_update.discard(canonical_id)
+            elif file_path not in {f for f, in remaining}:
+                self._remove_source(canonical_id, file_path)
+                to_update.add(canonical_id)
+        return to_delete, sorted(to_update)
+
+    def documents(self, canonical_ids:List[str]) -> List[Document]:
+        """
+        The canonical chunks with their merged metadata, ready to be re-upserted.
+        """
+        docs = []
+        for canonical_id in canonical_ids:
+            row = self._db.execute("SELECT text, metadata FROM canonical WHERE id = ?", (canonical_id,)).fetchone()
+            if row:
+                docs.append(Document(id=canonical_id, page_content=row[0], metadata=json.loads(row[1])))
+        return docs
+
+    def is_duplicate(self, file_path:str, chunk_id:str) -> bool:
+        row = self._db.execute("SELECT canonical_id FROM members WHERE file = ? AND chunk_id = ?",
+                               (file_path, chunk_id)).fetchone()
+        return row is not None and row[0] != chunk_id
+
+    def _update_sources(self, canonical_id:str, update):
+        metadata = json.loads(self._db.execute("SELECT metadata FROM canonical WHERE id = ?", (canonical_id,)).fetchone()[0])
+        metadata["sources"] = update(metadata.get("sources", []))
+        #the chunk is attributed to the first file that still contains it
+        if metadata["sources"]:
+            metadata["source"] = metadata["sources"][0]
+        self._db.execute("UPDATE canonical SET metadata = ? WHERE id = ?", (json.dumps(metadata), canonical_id))
+
+    def _add_source(self, canonical_id:str, source:str):
+        self._update_sources(canonical_id, lambda sources: sources if source in sources else sources + [source])
+
+    def _remove_source(self, canonical_id:str, source:str):
+        self._update_sources(canonical_id, lambda sources: [s for s in sources if s != source])
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def stats(self) -> Dict[str, int]:
+        canonical = self._db.execute("SELECT COUNT(*) FROM canonical").fetchone()[0]
+        members = self._db.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+        return {"canonical_chunks": canonical, "merged_chunks": members - canonical}
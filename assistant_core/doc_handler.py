@@ -3,216 +3,298 @@
 
 #libraries 
 import os
-import pytesseract
 import tempfile
-from typing import List
+import multiprocessing
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Tuple
 from pathlib import Path
 from langchain_community.document_loaders import TextLoader, PyMuPDFLoader, Docx2txtLoader#langchain wrapper for loading documents from a directory
 from langchain_community.document_loaders.image import UnstructuredImageLoader
-from langchain_core.prompts import ChatPromptTemplate
 from langchain.docstore.document import Document
-from pdf2image import convert_from_path
-from PIL import Image
-from config.logging import doc_handler_logger
+from assistant_core.ocr import iter_ocr_pages, ocr_pdf_documents, cached_image_text
+from assistant_core.workers import init_cpu_worker
+from config.logging import doc_handler_logger, worker_log_queue
 
+#file types that can be indexed from the course directories
+supported_extensions = ['.pdf', '.docx', '.txt']
 
 
-#check if a pdf contains scanned images 
-def is_scanned_pdf(file_path):
+#OCR a scanned PDF into one document per page
+def load_scanned_pdf(file_path:str, metadata:dict = None) -> List[Document]:
     """
-    Checks if a PDF file contains scanned images
+    OCR a scanned PDF and return one Document per page with page-number metadata.
 
     Args:
         file_path (str): The path to the PDF file.
-    
+        metadata (dict): Metadata copied onto every page.
+
     Returns:
-         True if the PDF contains scanned images, otherwise False
+        List[Document]: The OCR'd pages, empty if OCR failed.
     """
     try:
-        loader = PyMuPDFLoader(file_path)
-        docs = loader.load()
-        content = "".join([doc.page_content for doc in docs])
-        return len(content) == 0
+        docs = list(ocr_pdf_documents(file_path, metadata=metadata))
+        doc_handler_logger.info(f"Extracted text from {len(docs)} pages of scanned PDF {file_path}")
+        return docs
     except Exception as e:
-        doc_handler_logger.error(f"""Error loading PDF file - the document contains scanend images {file_path}, 
+        doc_handler_logger.error(f"""Error extracting text from scanned PDF {file_path}, 
                                  Error: {e}""")
-        return True
-    
+        return []
+
 
-# Set up the OCR function to extract text from scanned images in a PDF file
-def extract_text_from_scanned_pdf(file_path):
+#load a pdf in a single pass, only sending pages without a text layer to OCR
+def load_pdf(file_path:str, name:str = None) -> List[Document]:
     """
-    Extracts text from a scanned PDF file using OCR.
+    Load a PDF once with PyMuPDF and keep the extracted text of every page that has a
+    text layer. Only the pages that came back empty (scanned pages) are OCR'd, so a
+    digital book with a few scanned pages never goes through full-document OCR.
 
     Args:
         file_path (str): The path to the PDF file.
+        name (str): Name used in progress messages, defaults to the file name.
 
     Returns:
-        str: The extracted text from the scanned PDF.
+        List[Document]: One document per page, in page order.
     """
+    name = name or os.path.basename(file_path)
     try:
-        # Use PyMuPDF to extract images from the PDF
-        docs = convert_from_path(file_path, dpi=300, poppler_path=
-                                 os.getenv("POPPLER_PATH", "/usr/bin"))
-        
-        # Extract text from each page using OCR
-        text = ""
-        for i, image in enumerate(docs):
-            page_text = pytesseract.image_to_string(image, lang="eng")
-            text += page_text + "\n"
-        doc_handler_logger.info(f"Extracted text from scanned PDF {file_path}")
-        return text
-    
+        docs = PyMuPDFLoader(file_path=file_path).load()
+    except Exception as e:
+        #PyMuPDF could not read the file at all, fall back to OCR of every page
+        doc_handler_logger.error(f"Error loading PDF file {file_path}, falling back to OCR. Error: {e}")
+        print(f"[OCR] Processing scanned PDF: {name}")
+        doc_handler_logger.info(f"[OCR] Processing scanned PDF: {name}")
+        return load_scanned_pdf(file_path, metadata = {"source":file_path})
+
+    scanned_pages = [i for i, d in enumerate(docs) if not d.page_content.strip()]
+    if not scanned_pages:
+        print(f"[PDF] Processing PDF: {name}")
+        doc_handler_logger.info(f"[PDF] Processing PDF: {name}")
+        return docs
+
+    print(f"[OCR] Processing {len(scanned_pages)} of {len(docs)} pages of scanned PDF: {name}")
+    doc_handler_logger.info(f"[OCR] Processing {len(scanned_pages)} of {len(docs)} pages of scanned PDF: {name}")
+    #OCR'd pages inherit the metadata PyMuPDF already read for that page
+    ocr_text = {}
+    try:
+        for page, text in iter_ocr_pages(file_path, pages=scanned_pages):
+            ocr_text[page] = text
     except Exception as e:
         doc_handler_logger.error(f"""Error extracting text from scanned PDF {file_path}, 
                                  Error: {e}""")
-        return None
 
+    pages = []
+    for i, d in enumerate(docs):
+        if i in ocr_text:
+            d.page_content = ocr_text[i]
+            d.metadata["ocr"] = True
+        if d.page_content.strip():
+            pages.append(d)
+    return pages
 
-#set up a function to load the documents from a directory 
-def load_documents_from_directory(directory_path:str) -> List[Document]:
+
+#set up a function to load a single document from disk
+def load_document_from_file(file_path:str, subject:str) -> List[Document]:
     """
-    Load documents from a specified directory using PyMuPDFLoader.
-    
+    Load a single PDF, DOCX or TXT file and tag every page with its subject.
+
     Args:
-        directory_path (str): The path to the directory containing the documents.
-        
+        file_path (str): The path to the file.
+        subject (str): The subject (folder name) the file belongs to.
+
     Returns:
-        list: A list of loaded documents.
+        list: The loaded documents, or an empty list if the file type is unsupported.
+    """
+    file = os.path.basename(file_path)
+    file_ext = os.path.splitext(file)[1].lower()
+
+    docs = []
+    if file_ext == ".pdf":
+        docs = load_pdf(file_path)
+    elif file_ext == ".docx":
+        print(f"[DOCX] Processing DOCX: {file}")
+        doc_handler_logger.info(f"[DOCX] Processing DOCX: {file}")
+        #load the docx file using Docx2txtLoader
+        loader = Docx2txtLoader(file_path=file_path)
+        docs = loader.load()
+    elif file_ext == ".txt":
+        print(f"[TXT] Processing TXT: {file}")
+        doc_handler_logger.info(f"[TXT] Processing TXT: {file}")
+        #load the txt file using TextLoader
+        loader = TextLoader(file_path=file_path, encoding="utf-8")
+        docs = loader.load()
+    else:
+        doc_handler_logger.warning(f"Unsupported file type: {file_ext}. Skipping file: {file_path}")
+        return []
+
+    for d in docs:
+        d.metadata["subject"] = subject
+    return docs
+
+
+#worker used by the process pool, errors are returned instead of raised so one file can't stop the run
+def _load_file_worker(file_path:str, subject:str):
+    try:
+        return file_path, load_document_from_file(file_path, subject), None
+    except Exception as e:
+        return file_path, [], str(e)
+
+
+#stream parsed files one by one, optionally across a process pool
+def iter_loaded_files(jobs:List[Tuple[str, str]], workers:int = None, progress = None):
     """
+    Parse a list of files and yield results as soon as each file is done. With a process
+    pool only a few files are parsed ahead of the consumer, so memory stays flat however
+    slowly the results are used (e.g. while the indexer embeds them).
+
+    Args:
+        jobs (list): (file_path, subject) of every file to parse.
+        workers (int): Number of worker processes, 1 parses serially in this process.
+            Defaults to the INGEST_WORKERS environment variable (1 if unset).
+        progress (callable): Optional callback called with (done, total, file_path) after each file.
 
-    supported_extensions = ['.pdf', '.docx', '.txt']
+    Yields:
+        tuple: (index, file_path, documents, error) where index is the file's position in `jobs`
+            and error is None on success.
+    """
+    if workers is None:
+        workers = int(os.getenv("INGEST_WORKERS", "1"))
+    total = len(jobs)
 
+    def report(done, file_path, error):
+        if error:
+            doc_handler_logger.error(f"Error loading file {file_path}, Error: {error}")
+        doc_handler_logger.info(f"[{done}/{total}] Loaded {file_path}")
+        if progress:
+            progress(done, total, file_path)
 
+    if workers <= 1:
+        for index, (file_path, subject) in enumerate(jobs):
+            _, docs, error = _load_file_worker(file_path, subject)
+            report(index + 1, file_path, error)
+            yield index, file_path, docs, error
+        return
+
+    #spawned workers do not inherit the caller's threads or models, log through the main process
+    #and split the CPU between their OCR threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_cpu_worker, initargs=(worker_log_queue(), workers)) as executor:
+        queued = iter(enumerate(jobs))
+        futures = {}
+        done = 0
+        while True:
+            for index, (file_path, subject) in islice(queued, 2 * workers - len(futures)):
+                futures[executor.submit(_load_file_worker, file_path, subject)] = index
+            if not futures:
+                break
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = futures.pop(future)
+                try:
+                    file_path, docs, error = future.result()
+                except Exception as e:
+                    #the worker process itself died (e.g. a crash inside a native parser)
+                    file_path, docs, error = jobs[index][0], [], str(e)
+                done += 1
+                report(done, file_path, error)
+                yield index, file_path, docs, error
+
+
+#stream the documents of a directory file by file, optionally across a process pool
+def iter_documents_from_directory(directory_path:str, workers:int = None, progress = None):
+    """
+    Parse every file in a directory and yield results as soon as each file is done.
+
+    Args:
+        directory_path (str): The path to the directory containing the documents.
+        workers (int): Number of worker processes, 1 parses serially in this process.
+            Defaults to the INGEST_WORKERS environment variable (1 if unset).
+        progress (callable): Optional callback called with (done, total, file_path) after each file.
+
+    Yields:
+        tuple: (index, file_path, documents, error) where index is the file's position in walk order
+            and error is None on success.
+    """
     # Check if the directory exists
     if not os.path.exists(directory_path):
         doc_handler_logger.error(f"Directory {directory_path} does not exist.")
-        return []
-    
-    all_documents = []
-    # Iterate through all files in the directory
+        return
+
+    jobs = []
     for subdir, _, files in os.walk(directory_path):
         subject = Path(subdir).name
         for file in files:
-            file_path = os.path.join(subdir, file)
-            file_ext = os.path.splitext(file)[1].lower()
-
-            #check if the file extension is supported 
-
-            if file_ext == ".pdf":
-                if is_scanned_pdf(file_path):
-                    print(f"[OCR] Processing scanned PDF: {file}")
-                    doc_handler_logger.info(f"[OCR] Processing scanned PDF: {file}")
-                    # Extract text from scanned PDF using OCR
-                    text = extract_text_from_scanned_pdf(file_path)
-                    if text:
-                        all_documents.append(Document(page_content = text,
-                                                       metadata = {"source":file_path, "subject":subject}))
-
-                else:
-                    try:
-                        print(f"[PDF] Processing PDF: {file}")
-                        doc_handler_logger.info(f"[PDF] Processing PDF: {file}")
-                        #load the pdf file using PyMuPDFLoader
-                        loader = PyMuPDFLoader(file_path=file_path)
-                        docs = loader.load()
-                        for d in docs:
-                            d.metadata["subject"] = subject
-                            all_documents.extend(d)
-                    except Exception as e:
-                        doc_handler_logger.error(f"Error loading PDF file {file_path}, Error: {e}")
-                        continue
-            elif file_ext == ".docx":
-                try:
-                    print(f"[DOCX] Processing DOCX: {file}")
-                    doc_handler_logger.info(f"[DOCX] Processing DOCX: {file}")
-                    #load the docx file using Docx2txtLoader
-                    loader = Docx2txtLoader(file_path=file_path)
-                    docs = loader.load()
-                    for d in docs:
-                        d.metadata["subject"] = subject
-                        all_documents.extend(d)
-                except Exception as e:
-                    doc_handler_logger.error(f"Error loading DOCX file {file_path}, Error: {e}")
-                    continue
-            elif file_ext == ".txt":
-                print(f"[TXT] Processing TXT: {file}")
-                doc_handler_logger.info(f"[TXT] Processing TXT: {file}")
-                #load the txt file using 
-                loader = TextLoader(file_path=file_path, encoding="utf-8")
-                docs = loader.load()
-                for d in docs:
-                    d.metadata["subject"] = subject
-                    all_documents.extend(d)
-            else:
-                doc_handler_logger.warning(f"Unsupported file type: {file_ext}. Skipping file: {file_path}")
-                continue
-    return all_documents
+            jobs.append((os.path.join(subdir, file), subject))
+    yield from iter_loaded_files(jobs, workers, progress)
 
-#load documents uploaded by users: Students
-def load_documents_from_upload(uploaded_files) -> List[Document]:
+
+#set up a function to load the documents from a directory 
+def load_documents_from_directory(directory_path:str, workers:int = None, progress = None) -> List[Document]:
     """
-    Load and parse uploaded documents (PDF, DOCX, TXT, Images).
+    Load documents from a specified directory using PyMuPDFLoader.
     
     Args:
-        uploaded_files: List of file-like objects (e.g. from FastAPI UploadFile or Streamlit st.file_uploader).
-    
+        directory_path (str): The path to the directory containing the documents.
+        workers (int): Number of worker processes used to parse files in parallel.
+        progress (callable): Optional callback called with (done, total, file_path) after each file.
+        
+    Returns:
+        list: A list of loaded documents, in the same order whether parsed serially or in parallel.
+    """
+    results = sorted(iter_documents_from_directory(directory_path, workers, progress), key=lambda r: r[0])
+    all_documents = []
+    for _, _, docs, _ in results:
+        all_documents.extend(docs)
+    return all_documents
+
+#parse a single uploaded file from its raw bytes
+def load_uploaded_file(filename:str, content:bytes) -> List[Document]:
+    """
+    Parse one uploaded file (PDF, DOCX, TXT or image) given its name and raw bytes.
+    Taking plain bytes instead of an upload object lets this run in a worker process.
+
+    Args:
+        filename (str): The original file name, used for the file type and the source metadata.
+        content (bytes): The file content.
+
     Returns:
         List[Document]: Parsed documents ready for embedding.
     """
+    #save file temporarily
+    suffix = os.path.splitext(filename)[-1].lower()
+    with tempfile.NamedTemporaryFile(delete= False, suffix=suffix) as temp_file:
+        temp_file.write(content)
+        temp_file_path = temp_file.name
+
+    docs = []
+    try:
+        if suffix == ".pdf":
+            docs = load_pdf(temp_file_path, name=filename)
+        elif suffix == ".docx":
+            print(f"[DOCX] Processing DOCX: {filename}")
+            doc_handler_logger.info(f"[DOCX] Processing DOCX: {filename}")
+            loader = Docx2txtLoader(file_path=temp_file_path)
+            docs = loader.load()
+        elif suffix == ".txt":
+            print(f"[TXT] Processing TXT: {filename}")
+            doc_handler_logger.info(f"[TXT] Processing TXT: {filename}")
+            loader = TextLoader(file_path=temp_file_path, encoding="utf-8")
+            docs = loader.load()
+        elif suffix in [".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".gif"]:
+            print(f"[Image] Processing Image: {filename}")
+            doc_handler_logger.info(f"[Image] Processing Image: {filename}")
+            #re-uploads of the same image come back from the OCR cache
+            text = cached_image_text(temp_file_path, lambda path: "\n\n".join(
+                d.page_content for d in UnstructuredImageLoader(file_path=path).load()))
+            docs = [Document(page_content = text, metadata = {})] if text.strip() else []
+        else:
+            doc_handler_logger.warning(f"Unsupported file type: {suffix}. Skipping file: {filename}")
+            return []
 
-    all_docs_user = []
-    for file in uploaded_files:
-        #save file temporarily
-        suffix = os.path.splitext(file.filename)[-1].lower()
-        with tempfile.NamedTemporaryFile(delete= False, suffix=suffix) as temp_file:
-            temp_file.write(file.file.read() if hasattr(file, "file") else file.read())
-            temp_file_path = temp_file.name
-
-        docs = []
-        try:
-            if suffix == ".pdf":
-                if is_scanned_pdf(temp_file_path):
-                    print(f"[OCR] Processing scanned PDF: {file.filename}")
-                    doc_handler_logger.info(f"[OCR] Processing scanned PDF: {file.filename}")
-                    # Extract text from scanned PDF using OCR
-                    text = extract_text_from_scanned_pdf(temp_file_path)
-                    if text:
-                        all_docs_user.append(Document(page_content = text,
-                                                       metadata = {"source":file.filename, "subject":"user_upload"}))
-
-                else:
-                    print(f"[PDF] Processing PDF: {file.filename}")
-                    doc_handler_logger.info(f"[PDF] Processing PDF: {file.filename}")
-                    loader = PyMuPDFLoader(file_path=temp_file_path)
-                    docs = loader.load()
-            elif suffix == ".docx":
-                print(f"[DOCX] Processing DOCX: {file.filename}")
-                doc_handler_logger.info(f"[DOCX] Processing DOCX: {file.filename}")
-                loader = Docx2txtLoader(file_path=temp_file_path)
-                docs = loader.load()
-            elif suffix == ".txt":
-                print(f"[TXT] Processing TXT: {file.filename}")
-                doc_handler_logger.info(f"[TXT] Processing TXT: {file.filename}")
-                loader = TextLoader(file_path=temp_file_path, encoding="utf-8")
-                docs = loader.load()
-            elif suffix in [".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".gif"]:
-                print(f"[Image] Processing Image: {file.filename}")
-                doc_handler_logger.info(f"[Image] Processing Image: {file.filename}")
-                loader = UnstructuredImageLoader(file_path=temp_file_path)
-                docs = loader.load()
-            else:
-                doc_handler_logger.warning(f"Unsupported file type: {suffix}. Skipping file: {file.filename}")
-                continue
-
-            for d in docs:
-                d.metadata["subject"] = "user_upload"
-                d.metadata["source"] = file.filename
-                all_docs_user.append(d)
-        finally:
-            # Clean up the temporary file
-            os.remove(temp_file_path)
-    return all_docs_user
-
-
-    
\ No newline at end of file
+        for d in docs:
+            d.metadata["subject"] = "user_upload"
+            d.metadata["source"] = filename
+        return docs
+    finally:
+        # Clean up the temporary file
+        os.remove(temp_file_path)
@@ -0,0 +1,83 @@
+#persistent, content-addressed cache in front of the embedding model
+import os
+import hashlib
+import unicodedata
+from array import array
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+from assistant_core.sqlite_cache import SQLiteLRUCache
+from config.logging import embedding_vec_logger
+
+
+def normalize_text(text:str) -> str:
+    """
+    Normalize chunk text before hashing so that chunks differing only in unicode
+    form or whitespace share one cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain embedding model with an on-disk cache keyed by the model name
+    plus a hash of the normalized text. Only texts that miss the cache reach the
+    wrapped model, so repeated corpus rebuilds and re-uploads skip the encode step.
+
+    Args:
+        embedder (Embeddings): The embedding model doing the actual encoding.
+        model_name (str): Name of the model, part of every cache key.
+        path (str): Path to the SQLite cache file.
+        max_bytes (int): Size budget of the cache before LRU eviction kicks in.
+    """
+
+    def __init__(self, embedder:Embeddings, model_name:str, path:str, max_bytes:int):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache = SQLiteLRUCache(path, table="embeddings", max_bytes=max_bytes)
+
+    def _key(self, text:str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def embed_documents(self, texts:List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        #encode each distinct missing text once, in a single batch
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embedder.embed_documents(list(missing.values()))
+            encoded = {key: array("f", vector).tobytes() for key, vector in zip(missing, vectors)}
+            self.cache.set_many(encoded)
+            found.update(encoded)
+        embedding_vec_logger.info(f"Embedded {len(texts)} texts, {len(texts) - len(missing)} served from cache.")
+        return [array("f", found[key]).tolist() for key in keys]
+
+    def embed_query(self, text:str) -> List[float]:
+        key = self._key(f"query:{text}")
+        cached = self.cache.get(key)
+        if cached is not None:
+            return array("f", cached).tolist()
+        vector = self.embedder.embed_query(text)
+        self.cache.set(key, array("f", vector).tobytes())
+        return vector
+
+    def put(self, texts:List[str], vectors:List[List[float]]):
+        """
+        Seed the cache with vectors that were computed elsewhere.
+        """
+        self.cache.set_many({self._key(text): array("f", vector).tobytes() for text, vector in zip(texts, vectors)})
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit/miss counters of the cache, used to confirm that rebuilds skip encoding.
+        """
+        return self.cache.stats()
+
+
+#cache location and budget, shared by the indexing job and the API
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite"))
+embedding_cache_max_bytes = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024")) * 1024 * 1024
@@ -1,16 +1,22 @@
 #libraries to set up embedding model and vector store
 import os 
-import pinecone
-from pinecone import Pinecone, ServerlessSpec
-import torch #library for GPU support
-from typing import List 
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List 
 from langchain.docstore.document import Document #langchain wrapper for document object
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter #langchain wrapper for splitting text into smaller chunks
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+from langchain_community.embeddings.huggingface import DEFAULT_QUERY_BGE_INSTRUCTION_EN
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_community.vectorstores import Chroma
-from langchain_pinecone import PineconeVectorStore
-from assistant_core.doc_handler import load_documents_from_directory
+from assistant_core.embedding_cache import CachedEmbeddings, embedding_cache_path, embedding_cache_max_bytes
+from assistant_core.lazy import lazy_singleton
+from assistant_core.metrics import timed
+from assistant_core.local_vector_store import LocalVectorStore
+from assistant_core.onnx_embeddings import OnnxEmbeddings
+from assistant_core.session_cache import SessionCache
 from config.logging import embedding_vec_logger
 
 
@@ -18,42 +24,131 @@ from config.logging import embedding_vec_logger
 
 load_dotenv() #load environment variables from .env file
 
-#set up the Pinecone API key and environment
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-if not pinecone_api_key:
-    embedding_vec_logger.error("PINECONE_API_KEY environment variable not set.")
-    raise ValueError("PINECONE_API_KEY environment variable not set.")
+#vector backend for the course corpus: "pinecone" (hosted) or "local" (on-disk index, no API key needed)
+vector_backend = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+if vector_backend not in ("pinecone", "local"):
+    embedding_vec_logger.error(f"Unknown VECTOR_BACKEND {vector_backend}.")
+    raise ValueError(f"Unknown VECTOR_BACKEND {vector_backend}, use 'pinecone' or 'local'.")
 
-#initialize pinecone 
-pc = Pinecone(api_key = os.getenv("PINECONE_API_KEY"))
+#folder of the local index
+local_index_dir = os.getenv("LOCAL_INDEX_DIR", "vector_index")
 
-#create index name and check for index existence
+#index name and namespace used for the course corpus
 index_name = "accounting-assistant-index"
+namespace = "financial_accounting"
 
-if index_name not in pc.list_indexes().names():
-    embedding_vec_logger.info(f"Creating index {index_name}...")
-    pc.create_index(index_name, 
-                          dimension=384, 
-                          metric="cosine",
-                          vector_type= "dense",
-                          spec=ServerlessSpec(
-                              cloud= "aws",
-                              region ="us-east-1"
-                          ), timeout= 10)
-else:
-    embedding_vec_logger.info(f"Index {index_name} already exists.")
+#models, clients and stores below are built on first use (or by the API's warm-up),
+#so importing this module stays cheap
+
+
+@lazy_singleton
+def get_pinecone_client():
+    """
+    The Pinecone client, the API key is checked when it is first needed.
+    """
+    from pinecone import Pinecone
+    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    if not pinecone_api_key:
+        embedding_vec_logger.error("PINECONE_API_KEY environment variable not set.")
+        raise ValueError("PINECONE_API_KEY environment variable not set.")
+    return Pinecone(api_key = pinecone_api_key)
+
+
+def ensure_index():
+    """
+    Create the Pinecone index if it does not exist yet. This is only called by the
+    indexing job (assistant_core/indexer.py) so that API startup never has to create it.
+    The local backend creates its folder on first use.
+    """
+    if vector_backend != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if index_name not in pc.list_indexes().names():
+        embedding_vec_logger.info(f"Creating index {index_name}...")
+        pc.create_index(index_name, 
+                              dimension=384, 
+                              metric="cosine",
+                              vector_type= "dense",
+                              spec=ServerlessSpec(
+                                  cloud= "aws",
+                                  region ="us-east-1"
+                              ), timeout= 10)
+    else:
+        embedding_vec_logger.info(f"Index {index_name} already exists.")
+
+
+#embedding model 
+embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
+
+#chunk sizes are measured in tokens of the embedding model, which truncates its input at 256
+#tokens including the two special tokens
+chunk_tokens = int(os.getenv("CHUNK_TOKENS", "254"))
+chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+
+@lazy_singleton
+def get_tokenizer():
+    """
+    The embedding model's tokenizer, used to measure chunk sizes.
+    """
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(embedding_model_name)
+
+
+def token_text_splitter(chunk_size: int = None, chunk_overlap: int = None) -> RecursiveCharacterTextSplitter:
+    """
+    Recursive splitter that measures length in embedding-model tokens instead of characters.
+    """
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        get_tokenizer(),
+        chunk_size = chunk_size or chunk_tokens,
+        chunk_overlap = chunk_overlap if chunk_overlap is not None else chunk_overlap_tokens
+    )
+
+
+def iter_chunks(docs: Iterable[Document], chunk_size: int = None, chunk_overlap: int = None) -> Iterator[Document]:
+    """
+    Split documents one at a time and yield their chunks as they are produced, so the
+    caller can embed them in batches without holding every chunk of a corpus in memory.
+
+    Args:
+        docs (Iterable[Document]): Documents to be chunked, e.g. a generator of loaded pages.
+        chunk_size (int): Maximum tokens per chunk, CHUNK_TOKENS by default.
+        chunk_overlap (int): Tokens shared by consecutive chunks, CHUNK_OVERLAP_TOKENS by default.
+
+    Yields:
+        Document: The next chunk.
+    """
+    text_splitter = token_text_splitter(chunk_size, chunk_overlap)
+    for doc in docs:
+        yield from text_splitter.split_documents([doc])
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    """
+    Group an iterable into lists of at most batch_size items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 #function for chunking 
-def chunk_docs(docs: List[Document], chunk_size: int = 800, chunk_overlap: int = 150) -> List[Document]:
+def chunk_docs(docs: List[Document], chunk_size: int = None, chunk_overlap: int = None) -> List[Document]:
     """
     This function is used to chunk documents into smaller pieces for embedding. 
-    It uses langchain's RecursiveCharacterTextSplitter to split the loaded documents into smaller chunks
+    It collects the chunks of iter_chunks into a list, for callers that need them all at once.
     
     Args:
         docs (List[Document]): List of documents to be chunked.
-        chunk_size (int): Size of each chunk.
-        chunk_overlap (int): Overlap between chunks.
+        chunk_size (int): Maximum tokens per chunk.
+        chunk_overlap (int): Overlap between chunks in tokens.
 
     Returns:
         List[Document]: List of chunked documents.
@@ -63,71 +158,106 @@ def chunk_docs(docs: List[Document], chunk_size: int = 800, chunk_overlap: int =
             print("No documents to chunk")
             embedding_vec_logger.error("No documents to chunk.")
             return []
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len
-        )
-        documents = text_splitter.split_documents(docs)
+        documents = list(iter_chunks(docs, chunk_size, chunk_overlap))
         embedding_vec_logger.info(f"Chunked {len(docs)} documents into {len(documents)} chunks.")
         return documents
     except Exception as e:
         embedding_vec_logger.error(f"Error in chunking documents: {e}")
         raise e
 
-#embedding model 
-embedding_model = HuggingFaceBgeEmbeddings(
-    model_name = "sentence-transformers/all-MiniLM-L6-v2",
-    model_kwargs = {
-        "device": "cuda" if torch.cuda.is_available() else "cpu",
-    }, 
-    encode_kwargs = {"normalize_embeddings": True}
-)
+#embedding engine: "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime on the CPU)
+embedding_backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+embedding_threads = int(os.getenv("EMBEDDING_THREADS", "0"))  #0 keeps the runtime default
+onnx_model_dir = os.getenv("ONNX_MODEL_DIR", os.path.join("cache", "onnx", embedding_model_name.split("/")[-1]))
 
-#getting the data extracted from the document handler module 
-course_dir = {
-    "financial_accounting": r"C:\Projects_ML\Accounting-Assistant-For-Students\data\financial_accounting",
-}
-all_docs = []
-for course, path in course_dir.items():
-    docs = load_documents_from_directory(path)
-    for doc in docs:
-        if isinstance(doc, tuple):
-            text, file_path = doc
-            #safe source fall back 
-            safe_source = str(file_path) if file_path else "unknown"
-            doc = Document(page_content=text, metadata={"source": safe_source})
-        
-        #make sure metadata exists
-        if "source" not in doc.metadata or doc.metadata["source"] is None:
-            doc.metadata["source"] = "unknown"
-        # safely add course metadata
-        doc.metadata["course"] = str(course)
-        
-        # append the fixed document
-        all_docs.append(doc)
 
-#chunk the documents into smaller pieces
-chunked_docs = chunk_docs(all_docs)
+def build_base_embedding_model(backend: str = embedding_backend, batch_size: int = embedding_batch_size,
+                               threads: int = embedding_threads) -> Embeddings:
+    """
+    Build the embedding engine. Every backend produces the same normalized MiniLM vectors
+    (int8 quantization shifts them very slightly), so they are interchangeable.
+
+    Args:
+        backend (str): "torch", "onnx" or "onnx-int8".
+        batch_size (int): Texts per forward pass.
+        threads (int): CPU threads used by the forward pass, 0 for the runtime default.
+
+    Returns:
+        Embeddings: The embedding model.
+    """
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(embedding_model_name,
+                              model_dir = onnx_model_dir,
+                              quantize = backend == "onnx-int8",
+                              batch_size = batch_size,
+                              threads = threads,
+                              query_instruction = DEFAULT_QUERY_BGE_INSTRUCTION_EN)
+    if backend != "torch":
+        embedding_vec_logger.error(f"Unknown EMBEDDING_BACKEND {backend}.")
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend}, use 'torch', 'onnx' or 'onnx-int8'.")
+    import torch #library for GPU support
+    from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+    if threads:
+        torch.set_num_threads(threads)
+    return HuggingFaceBgeEmbeddings(
+        model_name = embedding_model_name,
+        model_kwargs = {
+            "device": "cuda" if torch.cuda.is_available() else "cpu",
+        }, 
+        encode_kwargs = {"normalize_embeddings": True, "batch_size": batch_size}
+    )
+
+
+@lazy_singleton
+def get_embedding_model() -> CachedEmbeddings:
+    """
+    The embedding model every caller (corpus indexing, uploads, queries) uses: the configured
+    engine behind the on-disk embedding cache. Quantized vectors are cached apart from the exact ones.
+    """
+    return CachedEmbeddings(build_base_embedding_model(),
+                            model_name = embedding_model_name + (":int8" if embedding_backend == "onnx-int8" else ""),
+                            path = embedding_cache_path,
+                            max_bytes = embedding_cache_max_bytes)
+
+
+@lazy_singleton
+def get_doc_store() -> VectorStore:
+    """
+    Connect to the existing corpus index, the corpus is pushed by the indexing job:
+        python -m assistant_core.indexer
+    """
+    if vector_backend == "local":
+        return LocalVectorStore(embedding = get_embedding_model(),
+                                path = local_index_dir,
+                                nprobe = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+                                )
+    from langchain_pinecone import PineconeVectorStore
+    get_pinecone_client()  #fails early if the API key is missing
+    return PineconeVectorStore(index_name = index_name,
+                               embedding = get_embedding_model(),
+                               namespace = namespace
+                               )
 
 
-#push to pinecone index
-doc_store  = PineconeVectorStore.from_documents(chunked_docs, 
-                                     embedding_model, 
-                                     index_name = index_name,
-                                     namespace = "financial_accounting"
-                                     )
+def cache_embeddings(texts: List[str], vectors: List[List[float]]):
+    """
+    Put already computed vectors into the embedding cache (used when a spilled session is restored).
+    """
+    get_embedding_model().put(texts, vectors)
 
 
 
 #temporary storage for user uploaded documents
-def build_temp_doc_store(uploaded_docs: List[Document]) -> Chroma:
+@timed("session_store_build")
+def build_temp_doc_store(uploaded_docs: List[Document], collection_name: str = "user_uploads") -> Chroma:
     """
     Build a temporary in-memory Chroma vector store for user-uploaded documents.
     This avoids polluting the main Pinecone index with temporary data.
 
     Args:
         uploaded_docs (List[Document]): List of user-uploaded documents.
+        collection_name (str): Name of the in-memory collection, unique per session.
     
     Returns:
         Chroma: Chroma vector store containing embeddings of the uploaded documents.
@@ -141,12 +271,155 @@ def build_temp_doc_store(uploaded_docs: List[Document]) -> Chroma:
         # Build temporary in-memory Chroma store
         temp_doc_store = Chroma.from_documents(
             documents=chunked_uploaded_docs,
-            embedding=embedding_model,
-            collection_name="user_uploads",
+            embedding=get_embedding_model(),
+            collection_name=collection_name,
             persist_directory=None  # In-memory, won't persist after session ends
         )
         embedding_vec_logger.info(f"Built temporary document store with {len(chunked_uploaded_docs)} chunks from uploaded documents.")
         return temp_doc_store
     except Exception as e:
         embedding_vec_logger.error(f"Error building temporary document store: {e}")
-        raise e
\ No newline at end of file
+        raise e
+
+
+def estimate_store_bytes(store: Chroma) -> int:
+    """
+    Rough size of an in-memory Chroma store: one float32 vector plus the chunk text per entry.
+    """
+    data = store.get(include=["documents"])
+    return sum(384 * 4 + len(text.encode("utf-8")) for text in data["documents"])
+
+
+def drop_temp_doc_store(session_id: str, store: Chroma, reason: str = "removed"):
+    """
+    Free the in-memory collection of a session whose store left the cache.
+    """
+    try:
+        store.delete_collection()
+        embedding_vec_logger.info(f"Dropped temporary document store for session {session_id} ({reason}).")
+    except Exception as e:
+        embedding_vec_logger.error(f"Error dropping temporary document store for session {session_id}: {e}")
+
+
+#per-session upload stores, built once and reused by every later query of the session
+session_doc_stores = SessionCache(
+    ttl = float(os.getenv("SESSION_STORE_TTL_SECONDS", "3600")),
+    max_bytes = int(os.getenv("SESSION_STORE_MAX_MB", "512")) * 1024 * 1024,
+    on_evict = drop_temp_doc_store
+)
+#session id -> [reentrant lock, number of threads holding or waiting for it]
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+
+
+@contextmanager
+def session_lock(session_id: str):
+    """
+    Hold the lock of one upload session, so concurrent builds and additions of its vector
+    store never race. It is reentrant: a caller may hold it around add_to_session_doc_store.
+    """
+    with _session_locks_guard:
+        entry = _session_locks.setdefault(session_id, [threading.RLock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _session_locks_guard:
+            entry[1] -= 1
+
+
+def prune_session_locks(in_use: Callable[[str], bool] = None) -> int:
+    """
+    Forget the locks of sessions that have no vector store, that no thread is holding or
+    waiting for, and that `in_use` (e.g. "has an upload job") does not claim.
+
+    Returns:
+        int: The number of locks removed.
+    """
+    with _session_locks_guard:
+        idle = [session_id for session_id, (_, users) in _session_locks.items()
+                if users == 0 and session_id not in session_doc_stores and not (in_use and in_use(session_id))]
+        for session_id in idle:
+            del _session_locks[session_id]
+    return len(idle)
+
+
+def get_session_doc_store(session_id: str, uploaded_docs: List[Document]) -> Chroma:
+    """
+    Return the cached vector store of a session, building it from the uploaded documents
+    on first use (or after it expired) so later queries only pay for a similarity search.
+
+    Args:
+        session_id (str): The upload session id.
+        uploaded_docs (List[Document]): The documents uploaded in that session.
+
+    Returns:
+        Chroma: The session's vector store, or None if there are no uploaded documents.
+    """
+    if not session_id or not uploaded_docs:
+        return None
+    store = session_doc_stores.get(session_id)
+    if store is not None:
+        return store
+
+    #concurrent first queries of the same session build the store only once
+    with session_lock(session_id):
+        store = session_doc_stores.peek(session_id)
+        if store is None:
+            #a fresh collection name per build so dropping an old store never touches a new one
+            store = build_temp_doc_store(uploaded_docs, collection_name=f"user_uploads_{session_id}_{uuid.uuid4().hex[:8]}")
+            if store is not None:
+                session_doc_stores.put(session_id, store, estimate_store_bytes(store))
+    return store
+
+
+@timed("upload_embed")
+def add_to_session_doc_store(session_id: str, new_docs: List[Document], all_docs: List[Document],
+                             progress = None, batch_size: int = 64) -> int:
+    """
+    Embed newly parsed documents into a session's vector store as soon as they are ready,
+    so the session can be queried while the rest of its upload is still being processed.
+
+    Args:
+        session_id (str): The upload session id.
+        new_docs (List[Document]): Documents that are not in the store yet.
+        all_docs (List[Document]): Every document of the session so far, used if the store
+            has to be rebuilt because it was evicted.
+        progress (callable): Optional callback receiving the number of chunks embedded so far.
+        batch_size (int): Chunks embedded per batch.
+
+    Returns:
+        int: The number of chunks embedded.
+    """
+    with session_lock(session_id):
+        store = session_doc_stores.peek(session_id)
+        docs_to_embed = new_docs
+        if store is None:
+            store = Chroma(collection_name=f"user_uploads_{session_id}_{uuid.uuid4().hex[:8]}",
+                           embedding_function=get_embedding_model())
+            docs_to_embed = all_docs
+        embedded = 0
+        for batch in iter_batches(iter_chunks(docs_to_embed), batch_size):
+            store.add_documents(batch)
+            embedded += len(batch)
+            if progress:
+                progress(embedded)
+        session_doc_stores.put(session_id, store, estimate_store_bytes(store))
+    embedding_vec_logger.info(f"Added {embedded} chunks to the document store of session {session_id}.")
+    return embedded
+
+
+def export_session_embeddings(session_id: str):
+    """
+    Return the chunk texts and embeddings of a session's resident vector store, so they can
+    be spilled to disk together with the session's documents.
+
+    Returns:
+        tuple: (texts, vectors), both empty if the session has no resident store.
+    """
+    store = session_doc_stores.peek(session_id)
+    if store is None:
+        return [], []
+    data = store.get(include=["documents", "embeddings"])
+    return list(data["documents"]), [list(vector) for vector in data["embeddings"]]
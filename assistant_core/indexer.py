@@ -0,0 +1,350 @@
+#incremental, manifest-driven indexing job for the course corpus
+#run it whenever the course library changes:
+#   python -m assistant_core.indexer            (only embeds added/changed files)
+#   python -m assistant_core.indexer --full     (re-embeds everything)
+import os
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, List
+from langchain.docstore.document import Document
+from assistant_core.dedup import DedupIndex
+from assistant_core.doc_handler import iter_loaded_files, load_document_from_file, supported_extensions
+from assistant_core.embedding_vec import iter_batches, iter_chunks, get_doc_store, ensure_index, get_embedding_model, vector_backend, local_index_dir
+from assistant_core.lexical_index import get_lexical_index
+from config.logging import indexer_logger
+
+
+def parse_course_dirs(spec:str) -> Dict[str, str]:
+    """
+    Parse course folders given as "name=folder" entries separated by os.pathsep
+    (":" on Linux, ";" on Windows), e.g. "financial_accounting=data".
+    """
+    courses = {}
+    for entry in filter(None, (e.strip() for e in spec.split(os.pathsep))):
+        name, sep, folder = entry.partition("=")
+        if not sep or not name.strip() or not folder.strip():
+            raise ValueError(f"Invalid course folder '{entry}', expected name=folder.")
+        courses[name.strip()] = folder.strip()
+    return courses
+
+
+#course folders that make up the knowledge base, the repo's data/ tree (one subject per subfolder)
+#unless COURSE_DIRS or --course says otherwise
+default_data_dir = str(Path(__file__).resolve().parent.parent / "data")
+course_dir = parse_course_dirs(os.getenv("COURSE_DIRS", f"financial_accounting={default_data_dir}"))
+
+#chunks embedded and upserted per batch while a file is being chunked
+index_batch_size = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+
+#the local vector index is compacted after a run once this share of its rows are deleted
+#(re-indexed files leave their old vectors behind as tombstones)
+compact_deleted_fraction = float(os.getenv("COMPACT_DELETED_FRACTION", "0.2"))
+
+#default of index_corpus's `lexical` argument: the configured corpus BM25 index
+configured_lexical_index = object()
+
+#processes that parse files while the indexer embeds the ones already parsed (1 parses in-process)
+ingest_workers = int(os.getenv("INGEST_WORKERS", "1"))
+
+#near-duplicate chunks are merged into one vector (DEDUP_ENABLED=0 turns it off)
+dedup_enabled = os.getenv("DEDUP_ENABLED", "1") == "1"
+dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+#manifest of content hashes per file and chunk ids per file
+#(the local backend keeps its manifest next to the index, so switching backends re-indexes)
+manifest_path = os.getenv("INDEX_MANIFEST_PATH",
+                          os.path.join(local_index_dir, "manifest.json") if vector_backend == "local" else "index_manifest.json")
+
+
+#registry of canonical and merged chunks, kept next to the manifest it belongs to
+dedup_path = os.getenv("DEDUP_INDEX_PATH", os.path.splitext(manifest_path)[0] + "_dedup.sqlite")
+
+
+def file_hash(file_path:str) -> str:
+    """
+    Compute the sha256 hash of a file's content, reading it in blocks.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def chunk_id(source:str, text:str) -> str:
+    """
+    Build a stable vector id for a chunk from its source file and its text, so an
+    unchanged chunk keeps the same id across runs and is never re-embedded.
+    """
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def load_manifest(path:str = manifest_path) -> Dict:
+    """
+    Load the indexing manifest, or return an empty one if it does not exist yet.
+    """
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest:Dict, path:str = manifest_path):
+    """
+    Write the manifest atomically so a crash mid-run never leaves a corrupt file.
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def iter_corpus_files(courses:Dict[str, str]):
+    """
+    Walk every course folder and yield (course, subject, file_path) for supported files.
+    """
+    for course, path in courses.items():
+        if not os.path.exists(path):
+            indexer_logger.error(f"Directory {path} for course {course} does not exist.")
+            continue
+        for subdir, _, files in os.walk(path):
+            subject = Path(subdir).name
+            for file in sorted(files):
+                if os.path.splitext(file)[1].lower() in supported_extensions:
+                    yield course, subject, os.path.join(subdir, file)
+
+
+def iter_file_chunks(file_path:str, course:str, subject:str, docs:List[Document] = None) -> Iterator[Document]:
+    """
+    Load a single corpus file (unless its parsed pages are given) and yield its chunks one by one,
+    tagged with the course and a stable id.
+    """
+    if docs is None:
+        docs = load_document_from_file(file_path, subject)
+    for doc in docs:
+        #make sure metadata exists
+        if doc.metadata.get("source") is None:
+            doc.metadata["source"] = file_path
+        doc.metadata["course"] = str(course)
+
+    seen_ids = set()
+    for chunk in iter_chunks(docs):
+        cid = chunk_id(file_path, chunk.page_content)
+        #identical passages inside one file collapse into a single vector
+        if cid in seen_ids:
+            continue
+        seen_ids.add(cid)
+        chunk.id = cid
+        yield chunk
+
+
+def index_corpus(courses:Dict[str, str] = course_dir, path:str = manifest_path,
+                 vector_store = None, lexical = configured_lexical_index, dedup = None,
+                 full:bool = False, dry_run:bool = False, workers:int = ingest_workers,
+                 compact_threshold:float = compact_deleted_fraction) -> Dict:
+    """
+    Bring the vector index in line with the course folders. Only files whose content hash
+    changed since the last run are re-chunked, and only chunks that are new are embedded
+    and upserted. Vectors of chunks that disappeared, and of files that were removed, are deleted.
+    Near-duplicate chunks (repeated notes, "(1)" copies) are merged into one vector whose
+    metadata lists every source file; it is only deleted once no file contains it any more.
+
+    Args:
+        courses (dict): Mapping of course name to folder path.
+        path (str): Path to the manifest file.
+        vector_store: Vector store to upsert into, defaults to the configured corpus doc store.
+        lexical: BM25 index kept in sync with the vector store, rebuilt at the end of the run
+            (defaults to the configured one, None to skip).
+        dedup (DedupIndex): Near-duplicate registry, defaults to the one next to the manifest (None if disabled).
+        full (bool): Ignore the stored hashes and re-embed every chunk.
+        dry_run (bool): Only report what would change.
+        workers (int): Processes parsing files ahead of the embedding step, 1 parses serially.
+        compact_threshold (float): Deleted share of a local vector index above which it is compacted
+            at the end of the run (0 compacts whenever anything is deleted).
+
+    Returns:
+        dict: Counts of files and chunks that were added, updated, unchanged or removed.
+    """
+    vector_store = vector_store or get_doc_store()
+    if lexical is configured_lexical_index:
+        lexical = get_lexical_index()
+    if dedup is None and dedup_enabled and not dry_run:
+        dedup = DedupIndex(dedup_path if path == manifest_path else os.path.splitext(path)[0] + "_dedup.sqlite",
+                           threshold = dedup_threshold)
+    manifest = load_manifest(path)
+    files = manifest.setdefault("files", {})
+    stats = {"files_added": 0, "files_updated": 0, "files_unchanged": 0, "files_removed": 0,
+             "files_failed": 0, "chunks_upserted": 0, "chunks_deleted": 0, "chunks_deduplicated": 0}
+    upsert_seconds = 0.0
+
+    def upsert(docs):
+        nonlocal upsert_seconds, lexical_changed
+        start = time.perf_counter()
+        vector_store.add_documents(docs, ids=[doc.id for doc in docs])
+        upsert_seconds += time.perf_counter() - start
+        if lexical is not None:
+            lexical.add_documents(docs)
+            lexical_changed = True
+
+    def release(file_path, chunk_ids):
+        #drop chunks of a file, keeping merged vectors that other files still contain
+        nonlocal lexical_changed
+        to_delete, to_update = dedup.release(file_path, chunk_ids) if dedup else (list(chunk_ids), [])
+        if to_delete:
+            vector_store.delete(ids=to_delete)
+            if lexical is not None:
+                lexical.delete(to_delete)
+                lexical_changed = True
+        if to_update:
+            upsert(dedup.documents(to_update))
+        return len(to_delete)
+
+    #a lexical index that is new (or was deleted) is backfilled from the unchanged files as well
+    backfill_lexical = lexical is not None and not dry_run and bool(files) and lexical.count() == 0
+    lexical_changed = backfill_lexical
+
+    #hash every file first, only the ones that changed (or need a lexical backfill) are parsed
+    seen = set()
+    to_parse = []
+    for course, subject, file_path in iter_corpus_files(courses):
+        seen.add(file_path)
+        try:
+            digest = file_hash(file_path)
+        except Exception as e:
+            stats["files_failed"] += 1
+            indexer_logger.error(f"Error indexing file {file_path}, Error: {e}")
+            continue
+        entry = files.get(file_path)
+        if entry and entry["hash"] == digest and not full and not backfill_lexical:
+            stats["files_unchanged"] += 1
+            continue
+        to_parse.append((course, subject, file_path, digest, entry))
+
+    #files are parsed in worker processes while this process chunks, embeds and upserts the finished ones
+    for index, file_path, docs, error in iter_loaded_files([(f, s) for _, s, f, _, _ in to_parse], workers):
+        course, subject, _, digest, entry = to_parse[index]
+        try:
+            if error:
+                raise RuntimeError(error)
+            if entry and entry["hash"] == digest and not full:
+                for batch in iter_batches(iter_file_chunks(file_path, course, subject, docs), index_batch_size):
+                    lexical.add_documents([c for c in batch if not (dedup and dedup.is_duplicate(file_path, c.id))])
+                stats["files_unchanged"] += 1
+                continue
+
+            #chunks stream from the splitter into the vector store batch by batch,
+            #only their ids are kept for the manifest
+            old_ids = set(entry["chunk_ids"]) if entry else set()
+            new_ids = []
+            upserted = duplicates = 0
+            merged = set()
+            for batch in iter_batches(iter_file_chunks(file_path, course, subject, docs), index_batch_size):
+                new_ids.extend(chunk.id for chunk in batch)
+                to_upsert = []
+                for chunk in batch:
+                    if chunk.id in old_ids and not full:
+                        continue
+                    if dedup is not None:
+                        canonical_id, is_canonical = dedup.register(file_path, chunk)
+                        if not is_canonical:
+                            duplicates += 1
+                            merged.add(canonical_id)
+                            continue
+                        #upsert the registry's copy, its metadata lists every source file
+                        chunk = dedup.documents([canonical_id])[0]
+                    to_upsert.append(chunk)
+                if to_upsert and not dry_run:
+                    upsert(to_upsert)
+                upserted += len(to_upsert)
+            to_delete = list(old_ids - set(new_ids))
+
+            deleted = len(to_delete)
+            if not dry_run:
+                deleted = release(file_path, to_delete)
+                if merged:
+                    #the canonical vectors now also name this file as a source
+                    upsert(dedup.documents(sorted(merged)))
+                if dedup is not None:
+                    dedup.commit()
+                files[file_path] = {"hash": digest, "course": course, "chunk_ids": new_ids}
+                save_manifest(manifest, path)
+
+            stats["files_updated" if entry else "files_added"] += 1
+            stats["chunks_upserted"] += upserted
+            stats["chunks_deleted"] += deleted
+            stats["chunks_deduplicated"] += duplicates
+            indexer_logger.info(f"Indexed {file_path}: {upserted} chunks upserted, {duplicates} merged as near-duplicates, "
+                                f"{deleted} deleted.")
+        except Exception as e:
+            #a broken file must not stop the rest of the run, it is retried next time
+            if dedup is not None:
+                dedup.rollback()
+            stats["files_failed"] += 1
+            indexer_logger.error(f"Error indexing file {file_path}, Error: {e}")
+
+    #drop vectors of files that were removed from the indexed course folders
+    #(a course folder that is missing altogether is treated as unavailable, not deleted)
+    available = {course for course, folder in courses.items() if os.path.exists(folder)}
+    for file_path in [p for p, e in files.items() if e["course"] in available and p not in seen]:
+        stale_ids = files[file_path]["chunk_ids"]
+        deleted = len(stale_ids)
+        if not dry_run:
+            deleted = release(file_path, stale_ids)
+            if dedup is not None:
+                dedup.commit()
+            del files[file_path]
+            save_manifest(manifest, path)
+        stats["files_removed"] += 1
+        stats["chunks_deleted"] += deleted
+        indexer_logger.info(f"Removed {file_path}: {deleted} chunks deleted.")
+
+    if lexical_changed:
+        lexical.build()
+
+    #only the local backend keeps tombstones, Pinecone reclaims deleted vectors itself
+    if not dry_run and hasattr(vector_store, "compact"):
+        deleted_fraction = vector_store.deleted_fraction()
+        if deleted_fraction > 0 and deleted_fraction >= compact_threshold:
+            vector_store.compact()
+            stats["compacted_deleted_fraction"] = round(deleted_fraction, 4)
+
+    #vectors and (estimated from this run's upsert rate) embedding time saved by deduplication
+    if dedup is not None:
+        per_chunk = upsert_seconds / stats["chunks_upserted"] if stats["chunks_upserted"] else 0.0
+        stats["dedup"] = dict(dedup.stats(),
+                              vectors_saved_this_run = stats["chunks_deduplicated"],
+                              embedding_seconds_saved_estimate = round(per_chunk * stats["chunks_deduplicated"], 2))
+
+    #the embedding cache shows how much of the run skipped the encode step
+    stats["embedding_cache"] = get_embedding_model().stats()
+    indexer_logger.info(f"Indexing finished: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally index the course library into the vector store.")
+    parser.add_argument("--full", action="store_true", help="re-embed every file, ignoring stored hashes")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without touching the index")
+    parser.add_argument("--manifest", default=manifest_path, help="path to the indexing manifest")
+    parser.add_argument("--compact", action="store_true",
+                        help="compact the local vector index whatever share of it is deleted")
+    parser.add_argument("--workers", type=int, default=ingest_workers,
+                        help="processes parsing files in parallel (default: INGEST_WORKERS or 1)")
+    parser.add_argument("--course", action="append", metavar="NAME=FOLDER",
+                        help="course folder to index, repeatable (default: COURSE_DIRS or the repo's data/ folder)")
+    args = parser.parse_args()
+    courses = parse_course_dirs(os.pathsep.join(args.course)) if args.course else course_dir
+
+    if not args.dry_run:
+        ensure_index()
+    print(index_corpus(courses=courses, path=args.manifest, full=args.full, dry_run=args.dry_run,
+                       workers=args.workers, compact_threshold=0.0 if args.compact else compact_deleted_fraction))
@@ -0,0 +1,40 @@
+#thread-safe, lazily built singletons for expensive models and clients
+import time
+import threading
+from functools import wraps
+from typing import Any, Callable
+from config.logging import main_app_logger
+
+
+def lazy_singleton(factory:Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Decorator turning a zero-argument factory into a getter that builds the object on the
+    first call and returns the same object afterwards. Concurrent first calls build it only
+    once, and a failed build is retried on the next call.
+
+    The getter also gets `peek()` (the object or None, never builds) and `reset()`.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @wraps(factory)
+    def getter():
+        if instance:
+            return instance[0]
+        with lock:
+            if not instance:
+                start = time.perf_counter()
+                instance.append(factory())
+                main_app_logger.info(f"Initialized {factory.__name__} in {time.perf_counter() - start:.2f}s.")
+        return instance[0]
+
+    def peek():
+        return instance[0] if instance else None
+
+    def reset():
+        with lock:
+            instance.clear()
+
+    getter.peek = peek
+    getter.reset = reset
+    return getter
@@ -0,0 +1,327 @@
+#BM25 lexical index: exact-term retrieval ("IAS 16", "FIFO", "debit note") next to the dense vectors
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from assistant_core.embedding_vec import chunk_docs
+from assistant_core.lazy import lazy_singleton
+from assistant_core.session_cache import SessionCache
+from config.logging import indexer_logger
+
+
+token_pattern = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+stopwords = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or "
+    "that the their this to was were what when where which who why will with you your".split()
+)
+
+#metadata keys that can be used in search filters
+filterable_keys = ("subject", "course")
+
+
+def tokenize(text:str) -> List[str]:
+    """
+    Lowercase word tokens without stopwords. A word followed by a number is also kept as one
+    token, so standards and course codes like "IAS 16" or "FIN 310" match as a unit.
+    """
+    words = token_pattern.findall(text.lower())
+    tokens = [w for w in words if w not in stopwords]
+    tokens += [a + b for a, b in zip(words, words[1:]) if b.isdigit() and a.isalpha() and len(a) <= 5]
+    return tokens
+
+
+def build_postings(token_lists:List[List[str]]):
+    """
+    Build compact posting lists from the tokens of every document.
+
+    Returns:
+        tuple: (vocab, postings, freqs, doc_lens) where vocab maps a term to (offset, document
+        frequency) into the uint32 document numbers `postings` and uint16 term counts `freqs`.
+    """
+    by_term: Dict[str, List[Tuple[int, int]]] = {}
+    for doc, tokens in enumerate(token_lists):
+        for term, tf in Counter(tokens).items():
+            by_term.setdefault(term, []).append((doc, tf))
+    vocab, postings, freqs = {}, [], []
+    for term in sorted(by_term):
+        entries = by_term[term]
+        vocab[term] = (len(postings), len(entries))
+        postings.extend(doc for doc, _ in entries)
+        freqs.extend(min(tf, 65535) for _, tf in entries)
+    return (vocab,
+            np.asarray(postings, dtype=np.uint32),
+            np.asarray(freqs, dtype=np.uint16),
+            np.asarray([len(tokens) for tokens in token_lists], dtype=np.uint32))
+
+
+class BM25:
+    """
+    Okapi BM25 scoring over posting arrays, which may be in memory or memory-mapped.
+    """
+
+    def __init__(self, vocab:Dict[str, Tuple[int, int]], postings:np.ndarray, freqs:np.ndarray,
+                 doc_lens:np.ndarray, k1:float = 1.5, b:float = 0.75):
+        self.vocab = vocab
+        self.postings = postings
+        self.freqs = freqs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lens)
+        self.avgdl = (float(np.mean(doc_lens)) if self.n_docs else 0.0) or 1.0
+
+    def top(self, query:str, k:int, mask:Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        The k best (document number, score) pairs for a query, documents outside `mask` excluded.
+        """
+        if not self.n_docs:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            docs = np.asarray(self.postings[offset:offset + df])
+            tf = np.asarray(self.freqs[offset:offset + df], dtype=np.float32)
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lens[docs]) / self.avgdl)
+            scores[docs] += idf * tf * (self.k1 + 1) / norm
+        if mask is not None:
+            scores[~mask] = 0
+        hits = int(np.count_nonzero(scores))
+        if not hits:
+            return []
+        k = min(k, hits)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(doc), float(scores[doc])) for doc in top]
+
+
+def facet_mask(facets:Dict[str, Tuple[List, np.ndarray]], filter:Optional[dict], n_docs:int) -> Optional[np.ndarray]:
+    """
+    Boolean mask of the documents matching an equality filter such as {"subject": "finance"}.
+    """
+    if not filter:
+        return None
+    mask = np.ones(n_docs, dtype=bool)
+    for key, value in filter.items():
+        if key not in facets:
+            raise ValueError(f"Cannot filter on metadata key '{key}', use one of {filterable_keys}.")
+        values, codes = facets[key]
+        wanted = value.get("$in", [value.get("$eq")]) if isinstance(value, dict) else [value]
+        wanted_codes = [values.index(str(v)) for v in wanted if v is not None and str(v) in values]
+        mask &= np.isin(np.asarray(codes), wanted_codes)
+    return mask
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 index of the course corpus, kept in sync by the indexing job.
+
+    Chunk texts live in chunks.sqlite and are updated incrementally with the vector store;
+    `build` then rewrites the posting lists into a new segment folder (uint32 document
+    numbers, uint16 term counts, document lengths and filter codes as flat binary files)
+    and points current.json at it. Readers memory-map the current segment and reopen it
+    when current.json changes, so the API picks up a re-index without a restart.
+
+    Args:
+        path (str): Folder holding the index.
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "chunks.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._current_path = os.path.join(path, "current.json")
+        self._loaded_version = None
+        self._bm25 = None
+        self._rows = None
+        self._facets = {}
+
+    #writer side, used by the indexing job
+    def add_documents(self, docs:List[Document]):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                                 [(doc.id, doc.page_content, json.dumps(doc.metadata)) for doc in docs])
+            self._db.commit()
+
+    def delete(self, ids:List[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def build(self):
+        """
+        Rebuild the posting lists from every stored chunk and publish them as the current segment.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            records = self._db.execute("SELECT row, text, metadata FROM chunks ORDER BY row").fetchall()
+        token_lists = [tokenize(text) for _, text, _ in records]
+        vocab, postings, freqs, doc_lens = build_postings(token_lists)
+
+        segment = f"segment_{time.time_ns()}"
+        segment_path = os.path.join(self.path, segment)
+        os.makedirs(segment_path)
+        postings.tofile(os.path.join(segment_path, "postings.u32"))
+        freqs.tofile(os.path.join(segment_path, "freqs.u16"))
+        doc_lens.tofile(os.path.join(segment_path, "doc_lens.u32"))
+        np.asarray([row for row, _, _ in records], dtype=np.int64).tofile(os.path.join(segment_path, "rows.i64"))
+        facets = {}
+        metadatas = [json.loads(metadata) for _, _, metadata in records]
+        for key in filterable_keys:
+            values = sorted({str(m.get(key)) for m in metadatas if m.get(key) is not None})
+            codes = np.asarray([values.index(str(m[key])) if m.get(key) is not None else -1 for m in metadatas],
+                               dtype=np.int32)
+            codes.tofile(os.path.join(segment_path, f"facet_{key}.i32"))
+            facets[key] = values
+        with open(os.path.join(segment_path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump({"vocab": vocab, "facets": facets, "n_docs": len(records)}, f)
+
+        #publish atomically, then remove older segments (open memory maps keep their files alive)
+        temp_path = f"{self._current_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment}, f)
+        os.replace(temp_path, self._current_path)
+        for name in os.listdir(self.path):
+            if name.startswith("segment_") and name != segment:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        indexer_logger.info(f"Built lexical index: {len(records)} chunks, {len(vocab)} terms, "
+                            f"{postings.nbytes + freqs.nbytes} posting bytes in {time.perf_counter() - start:.2f}s.")
+
+    #reader side, used by the API
+    def _load(self):
+        if not os.path.exists(self._current_path):
+            return
+        version = os.path.getmtime(self._current_path)
+        if version == self._loaded_version:
+            return
+        with open(self._current_path, "r", encoding="utf-8") as f:
+            segment_path = os.path.join(self.path, json.load(f)["segment"])
+        with open(os.path.join(segment_path, "vocab.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        n_docs = meta["n_docs"]
+
+        def mapped(name, dtype):
+            #np.memmap cannot map empty files
+            if n_docs == 0 or os.path.getsize(os.path.join(segment_path, name)) == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(os.path.join(segment_path, name), dtype=dtype, mode="r")
+
+        self._bm25 = BM25({term: tuple(entry) for term, entry in meta["vocab"].items()},
+                          mapped("postings.u32", np.uint32), mapped("freqs.u16", np.uint16),
+                          mapped("doc_lens.u32", np.uint32))
+        self._rows = mapped("rows.i64", np.int64)
+        self._facets = {key: (values, mapped(f"facet_{key}.i32", np.int32)) for key, values in meta["facets"].items()}
+        self._loaded_version = version
+
+    def search(self, query:str, k:int = 5, filter:Optional[dict] = None) -> List[Document]:
+        with self._lock:
+            self._load()
+            if self._bm25 is None:
+                return []
+            hits = self._bm25.top(query, k, facet_mask(self._facets, filter, self._bm25.n_docs))
+            rows = [int(self._rows[doc]) for doc, _ in hits]
+            if not rows:
+                return []
+            found = {row: (doc_id, text, metadata) for row, doc_id, text, metadata in self._db.execute(
+                f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows)}
+        #chunks deleted since the last build are skipped
+        return [Document(id=found[row][0], page_content=found[row][1], metadata=json.loads(found[row][2]))
+                for row in rows if row in found]
+
+    def as_retriever(self, k:int = 5, filter:Optional[dict] = None) -> "LexicalRetriever":
+        return LexicalRetriever(index=self, k=k, filter=filter)
+
+
+class InMemoryLexicalIndex:
+    """
+    Small BM25 index over the chunks of one upload session.
+
+    Args:
+        docs (List[Document]): The session's chunks.
+    """
+
+    def __init__(self, docs:List[Document]):
+        self.docs = docs
+        self._bm25 = BM25(*build_postings([tokenize(doc.page_content) for doc in docs]))
+        self.size = sum(len(doc.page_content.encode("utf-8")) for doc in docs) + self._bm25.postings.nbytes * 2
+
+    def search(self, query:str, k:int = 5, filter:Optional[dict] = None) -> List[Document]:
+        return [self.docs[doc] for doc, _ in self._bm25.top(query, k)]
+
+    def as_retriever(self, k:int = 5, filter:Optional[dict] = None) -> "LexicalRetriever":
+        return LexicalRetriever(index=self, k=k, filter=filter)
+
+
+class LexicalRetriever(BaseRetriever):
+    """
+    LangChain retriever over a lexical index, so it can be fused with the dense retrievers
+    by the EnsembleRetriever (reciprocal rank fusion).
+    """
+
+    index: Any
+    k: int = 5
+    filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query:str, *, run_manager:CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search(query, self.k, self.filter)
+
+
+#the corpus index, filled by the indexing job next to the vector store
+lexical_index_dir = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+lexical_index_enabled = os.getenv("LEXICAL_INDEX_ENABLED", "1") == "1"
+
+
+@lazy_singleton
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """
+    Open the corpus BM25 index (creating its folder and database on first use), or None if it is disabled.
+    """
+    return LexicalIndex(lexical_index_dir) if lexical_index_enabled else None
+
+#per-session lexical indexes of uploads, rebuilt when the session gets more documents
+session_lexical_indexes = SessionCache(
+    ttl = float(os.getenv("SESSION_STORE_TTL_SECONDS", "3600")),
+    max_bytes = int(os.getenv("SESSION_LEXICAL_MAX_MB", "128")) * 1024 * 1024
+)
+
+
+def get_session_lexical_index(session_id:str, uploaded_docs:List[Document]) -> Optional[InMemoryLexicalIndex]:
+    """
+    Return the lexical index of a session's uploads, built from the same chunks as its vector store.
+
+    Args:
+        session_id (str): The upload session id.
+        uploaded_docs (List[Document]): The documents uploaded in that session.
+
+    Returns:
+        InMemoryLexicalIndex: The session's index, or None if there are no uploaded documents.
+    """
+    if not session_id or not uploaded_docs:
+        return None
+    cached = session_lexical_indexes.get(session_id)
+    if cached is not None and cached[0] == len(uploaded_docs):
+        return cached[1]
+    index = InMemoryLexicalIndex(chunk_docs(uploaded_docs))
+    session_lexical_indexes.put(session_id, (len(uploaded_docs), index), index.size)
+    return index
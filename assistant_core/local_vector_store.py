@@ -0,0 +1,402 @@
+#local on-disk vector store: memory-mapped float32 vectors with an IVF index
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from config.logging import embedding_vec_logger
+
+
+#metadata keys that can be used in search filters
+filterable_keys = ("subject", "course", "source")
+
+
+def nearest_centroid(vectors:np.ndarray, centroids:np.ndarray, batch_size:int = 8192) -> np.ndarray:
+    """
+    Index of the closest centroid of every vector, computed in batches to bound memory.
+    """
+    return np.concatenate([np.argmax(np.asarray(vectors[start:start + batch_size]) @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), batch_size)] or [np.zeros(0, dtype=np.int64)])
+
+
+def kmeans(vectors:np.ndarray, clusters:int, iterations:int = 10, seed:int = 0) -> np.ndarray:
+    """
+    Spherical k-means on normalized vectors, returns the normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        #re-seed empty clusters with random vectors
+        empty = np.bincount(assign, minlength=clusters) == 0
+        sums[empty] = vectors[rng.integers(len(vectors), size=int(empty.sum()))]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+    return centroids
+
+
+class LocalVectorStore(VectorStore):
+    """
+    A vector store that lives in a local folder, so retrieval needs no network round trip
+    and the service can run without a Pinecone key.
+
+    - vectors.f32: every vector as a row of float32, appended on add and memory-mapped for search
+    - docs.sqlite: id, text, metadata and a deleted flag for every row
+    - ivf.npz: IVF centroids and the cluster of every row
+
+    - index.json: vector dimension and a version that changes on every write
+
+    Searches probe the `nprobe` closest IVF clusters; below `min_ivf_size` rows, or when the
+    filter leaves too few candidates, they fall back to an exact scan. Adding an existing id
+    replaces it (upsert), deletes are tombstones that `compact` reclaims. Filters are equality
+    matches on subject/course/source, e.g. {"subject": "finance"} or {"course": {"$in": [...]}}.
+
+    Only the rows committed to docs.sqlite count: vectors are written before the rows, and
+    a tail left in vectors.f32 by an interrupted write is ignored and later overwritten.
+    Readers reopen the index when index.json changes, so the API picks up a re-index
+    without a restart.
+
+    Args:
+        embedding (Embeddings): The embedding model.
+        path (str): Folder holding the index files.
+        nprobe (int): IVF clusters searched per query.
+        min_ivf_size (int): Rows needed before the IVF index is used.
+    """
+
+    def __init__(self, embedding:Embeddings, path:str, nprobe:int = 8, min_ivf_size:int = 2048):
+        self._embedding = embedding
+        self.path = path
+        self.nprobe = nprobe
+        self.min_ivf_size = min_ivf_size
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._ivf_path = os.path.join(path, "ivf.npz")
+        self._info_path = os.path.join(path, "index.json")
+
+        self._db = sqlite3.connect(os.path.join(path, "docs.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (row INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+                         "text TEXT NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS docs_id ON docs (id)")
+        self._db.commit()
+        self._load()
+
+    #loading and persistence
+    def _load(self):
+        info = {}
+        self._loaded_version = self._version()
+        if os.path.exists(self._info_path):
+            with open(self._info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        self._dim = info.get("dim")
+        self._rows = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._facets: Dict[str, Dict[Any, List[int]]] = {key: {} for key in filterable_keys}
+        self._id_rows: Dict[str, int] = {}
+
+        for row, doc_id, metadata, deleted in self._db.execute("SELECT row, id, metadata, deleted FROM docs ORDER BY row"):
+            self._track(row, doc_id, json.loads(metadata), not deleted)
+        self._drop_rows_without_vectors()
+        self._vectors = self._open_vectors()
+
+        self._centroids = None
+        self._assign = np.full(self._rows, -1, dtype=np.int32)
+        self._trained_rows = 0
+        if os.path.exists(self._ivf_path):
+            ivf = np.load(self._ivf_path)
+            self._centroids = ivf["centroids"]
+            self._assign[:len(ivf["assign"])] = ivf["assign"][:self._rows]
+            self._trained_rows = int(ivf["trained_rows"])
+            self._assign_missing()
+        self._rebuild_lists()
+
+    def _version(self) -> Optional[int]:
+        return os.stat(self._info_path).st_mtime_ns if os.path.exists(self._info_path) else None
+
+    def _refresh(self):
+        """
+        Reload the index if another process (the indexing job) has written to it since it was loaded.
+        """
+        if self._version() != self._loaded_version:
+            self._load()
+
+    def _publish(self):
+        #write index.json atomically, its new mtime tells readers to reload
+        temp_path = f"{self._info_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "rows": self._rows}, f)
+        os.replace(temp_path, self._info_path)
+        self._loaded_version = self._version()
+
+    def _row_bytes(self) -> int:
+        return self._dim * np.dtype(np.float32).itemsize
+
+    def _drop_rows_without_vectors(self):
+        """
+        Rows whose vectors are missing can only be left by an interrupted compaction, they are dropped.
+        """
+        if not self._dim or self._rows == 0:
+            return
+        stored = os.path.getsize(self._vectors_path) // self._row_bytes() if os.path.exists(self._vectors_path) else 0
+        if stored >= self._rows:
+            return
+        embedding_vec_logger.error(f"Local vector index has {self._rows} rows but only {stored} vectors, "
+                                   f"dropping the rows without vectors.")
+        self._db.execute("DELETE FROM docs WHERE row >= ?", (stored,))
+        self._db.commit()
+        self._alive[stored:] = False
+        self._rows = stored
+        self._id_rows = {doc_id: row for doc_id, row in self._id_rows.items() if row < stored}
+        self._facets = {key: {value: [row for row in rows if row < stored] for value, rows in values.items()}
+                        for key, values in self._facets.items()}
+
+    def _open_vectors(self):
+        if not self._dim or not os.path.exists(self._vectors_path) or self._rows == 0:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        #only the committed rows are mapped, the file may be longer after an interrupted write
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+
+    def _track(self, row:int, doc_id:str, metadata:dict, alive:bool):
+        if row >= len(self._alive):
+            self._alive = np.concatenate([self._alive, np.zeros(max(1024, row + 1 - len(self._alive)), dtype=bool)])
+        self._alive[row] = alive
+        self._rows = max(self._rows, row + 1)
+        if alive:
+            self._id_rows[doc_id] = row
+            for key in filterable_keys:
+                value = metadata.get(key)
+                if isinstance(value, (str, int, float, bool)):
+                    self._facets[key].setdefault(value, []).append(row)
+
+    def _save_ivf(self):
+        if self._centroids is not None:
+            #write then rename, so a reader never loads a half-written file
+            temp_path = os.path.join(self.path, "ivf.tmp.npz")
+            np.savez(temp_path, centroids=self._centroids, assign=self._assign[:self._rows],
+                     trained_rows=self._trained_rows)
+            os.replace(temp_path, self._ivf_path)
+
+    #IVF index
+    def _train(self):
+        alive_rows = np.nonzero(self._alive[:self._rows])[0]
+        if len(alive_rows) < self.min_ivf_size:
+            return
+        clusters = int(min(4096, max(16, 4 * np.sqrt(len(alive_rows)))))
+        sample = np.random.default_rng(0).choice(alive_rows, min(len(alive_rows), 50 * clusters), replace=False)
+        self._centroids = kmeans(np.asarray(self._vectors[np.sort(sample)]), clusters)
+        self._assign = np.full(self._rows, -1, dtype=np.int32)
+        self._trained_rows = len(alive_rows)
+        self._assign_missing()
+        embedding_vec_logger.info(f"Trained IVF index with {clusters} clusters on {len(alive_rows)} vectors.")
+
+    def _assign_missing(self):
+        if self._centroids is None:
+            return
+        missing = np.nonzero(self._assign[:self._rows] < 0)[0]
+        for start in range(0, len(missing), 8192):
+            rows = missing[start:start + 8192]
+            self._assign[rows] = nearest_centroid(self._vectors[rows], self._centroids)
+
+    def _rebuild_lists(self):
+        self._lists = []
+        if self._centroids is None:
+            return
+        order = np.argsort(self._assign[:self._rows], kind="stable")
+        bounds = np.searchsorted(self._assign[:self._rows][order], np.arange(len(self._centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self._centroids))]
+
+    #VectorStore interface
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts:Iterable[str], metadatas:Optional[List[dict]] = None,
+                  ids:Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+        with self._lock:
+            self._refresh()
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+            #upsert: ids that already exist are replaced
+            self._delete_rows([self._id_rows[i] for i in ids if i in self._id_rows])
+
+            #vectors first, right after the committed rows (overwriting any uncommitted tail), then the rows
+            first = self._rows
+            with open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "wb") as f:
+                f.seek(first * self._row_bytes())
+                f.write(vectors.tobytes())
+                f.truncate()
+            self._db.executemany(
+                "INSERT INTO docs (row, id, text, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                [(first + n, doc_id, text, json.dumps(metadata))
+                 for n, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas))],
+            )
+            self._db.commit()
+            for n, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+                self._track(first + n, doc_id, metadata, True)
+            self._vectors = self._open_vectors()
+            self._assign = np.concatenate([self._assign, np.full(len(texts), -1, dtype=np.int32)])
+
+            #(re)train once the index is big enough or has doubled since the last training
+            alive = int(self._alive[:self._rows].sum())
+            if alive >= self.min_ivf_size and (self._centroids is None or alive > 2 * self._trained_rows):
+                self._train()
+            else:
+                self._assign_missing()
+            self._rebuild_lists()
+            self._save_ivf()
+            self._publish()
+        return ids
+
+    def delete(self, ids:Optional[List[str]] = None, **kwargs) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            self._refresh()
+            self._delete_rows([self._id_rows[i] for i in ids if i in self._id_rows])
+            self._db.commit()
+            self._publish()
+        return True
+
+    def _delete_rows(self, rows:List[int]):
+        if not rows:
+            return
+        self._db.executemany("UPDATE docs SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+        for row in rows:
+            self._alive[row] = False
+        self._id_rows = {doc_id: row for doc_id, row in self._id_rows.items() if self._alive[row]}
+
+    def _filter_mask(self, filter:Optional[dict]) -> np.ndarray:
+        mask = self._alive[:self._rows].copy()
+        for key, condition in (filter or {}).items():
+            if key not in self._facets:
+                raise ValueError(f"Cannot filter on metadata key '{key}', use one of {filterable_keys}.")
+            if isinstance(condition, dict):
+                values = condition.get("$in", [condition.get("$eq")])
+            else:
+                values = [condition]
+            allowed = np.zeros(self._rows, dtype=bool)
+            for value in values:
+                allowed[self._facets[key].get(value, [])] = True
+            mask &= allowed
+        return mask
+
+    def _search_rows(self, vector:np.ndarray, k:int, filter:Optional[dict] = None, exact:bool = False) -> List[Tuple[int, float]]:
+        with self._lock:
+            self._refresh()
+            if self._rows == 0:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) + 1e-12)
+            mask = self._filter_mask(filter)
+
+            candidates = None
+            if not exact and self._lists and self._rows >= self.min_ivf_size:
+                probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+                candidates = np.concatenate([self._lists[c] for c in probe])
+                candidates = candidates[mask[candidates]]
+                if len(candidates) < k:
+                    candidates = None
+            if candidates is None:
+                candidates = np.nonzero(mask)[0]
+            if len(candidates) == 0:
+                return []
+
+            candidates = np.sort(candidates)
+            scores = np.asarray(self._vectors[candidates]) @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _documents(self, rows:List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        if not rows:
+            return []
+        marks = ",".join("?" * len(rows))
+        with self._lock:
+            found = {row: (doc_id, text, metadata) for row, doc_id, text, metadata in
+                     self._db.execute(f"SELECT row, id, text, metadata FROM docs WHERE row IN ({marks})", [r for r, _ in rows])}
+        return [(Document(id=found[row][0], page_content=found[row][1], metadata=json.loads(found[row][2])), score)
+                for row, score in rows]
+
+    def similarity_search_by_vector_with_score(self, embedding:List[float], k:int = 4,
+                                               filter:Optional[dict] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self._documents(self._search_rows(np.asarray(embedding), k, filter, exact=kwargs.get("exact", False)))
+
+    def similarity_search_with_score(self, query:str, k:int = 4, filter:Optional[dict] = None,
+                                     **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter, **kwargs)
+
+    def similarity_search_by_vector(self, embedding:List[float], k:int = 4, filter:Optional[dict] = None,
+                                    **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter, **kwargs)]
+
+    def similarity_search(self, query:str, k:int = 4, filter:Optional[dict] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def get_by_ids(self, ids:List[str]) -> List[Document]:
+        with self._lock:
+            self._refresh()
+            rows = [(self._id_rows[i], 0.0) for i in ids if i in self._id_rows]
+        return [doc for doc, _ in self._documents(rows)]
+
+    @classmethod
+    def from_texts(cls, texts:List[str], embedding:Embeddings, metadatas:Optional[List[dict]] = None,
+                   ids:Optional[List[str]] = None, path:str = "vector_index", **kwargs) -> "LocalVectorStore":
+        store = cls(embedding, path, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def deleted_fraction(self) -> float:
+        """
+        Share of the stored rows that are deleted, i.e. the part of the index `compact` reclaims.
+        """
+        with self._lock:
+            self._refresh()
+            if self._rows == 0:
+                return 0.0
+            return 1.0 - int(self._alive[:self._rows].sum()) / self._rows
+
+    def compact(self):
+        """
+        Rewrite the index without deleted rows and retrain the IVF clusters.
+        """
+        with self._lock:
+            self._refresh()
+            alive_rows = np.nonzero(self._alive[:self._rows])[0]
+            if len(alive_rows) == self._rows:
+                return
+            vectors = np.asarray(self._vectors[alive_rows]) if len(alive_rows) else np.zeros((0, self._dim), np.float32)
+            records = self._db.execute("SELECT id, text, metadata FROM docs WHERE deleted = 0 ORDER BY row").fetchall()
+            temp_path = f"{self._vectors_path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(vectors.tobytes())
+            self._vectors = None
+            os.replace(temp_path, self._vectors_path)
+            self._db.execute("DELETE FROM docs")
+            self._db.executemany("INSERT INTO docs (row, id, text, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                                 [(n, *record) for n, record in enumerate(records)])
+            self._db.commit()
+            if os.path.exists(self._ivf_path):
+                os.remove(self._ivf_path)
+            self._load()
+            self._train()
+            self._rebuild_lists()
+            self._save_ivf()
+            self._publish()
+        embedding_vec_logger.info(f"Compacted local vector index to {len(alive_rows)} vectors.")
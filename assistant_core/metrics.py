@@ -0,0 +1,144 @@
+#in-process request metrics: stage latency histograms, counters and payload sizes in the Prometheus text format
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+
+#seconds, from a cache hit to a slow generation
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+#bytes or characters, from a short question to a large upload
+size_buckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class Histogram:
+    def __init__(self, buckets:Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters and histograms keyed by metric name and labels. Recording a
+    value is a dict lookup and a bisect under a lock, cheap enough to leave on in production;
+    the text exposition is only built when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {}
+        self._values: Dict[str, Dict[Tuple[Tuple[str, str], ...], object]] = {}
+
+    def describe(self, name:str, kind:str, description:str, buckets:Tuple[float, ...] = latency_buckets):
+        """
+        Declare a metric ("counter" or "histogram") before it is used.
+        """
+        self._kinds[name] = (kind, description, buckets if kind == "histogram" else None)
+        self._values.setdefault(name, {})
+
+    def inc(self, name:str, value:float = 1.0, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name:str, value:float, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._values[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._kinds[name][2])
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name:str, **labels):
+        """
+        Observe the duration of the block; failures are also counted in assistant_errors_total.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("assistant_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self, gauges:Optional[Dict[str, float]] = None) -> str:
+        """
+        All metrics in the Prometheus text exposition format, followed by point-in-time gauges.
+        """
+        lines = []
+        with self._lock:
+            for name, series in self._values.items():
+                kind, description, buckets = self._kinds[name]
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                for key, value in series.items():
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(key)} {value:g}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {value.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(key)} {value.count}")
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {float(value):g}"]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key:Iterable[Tuple[str, str]]) -> str:
+    key = list(key)
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+metrics = MetricsRegistry()
+metrics.describe("assistant_stage_seconds", "histogram", "Latency of a pipeline stage in seconds.")
+metrics.describe("assistant_errors_total", "counter", "Stages that raised an exception.")
+metrics.describe("assistant_http_requests_total", "counter", "HTTP requests by route, method and status.")
+metrics.describe("assistant_http_request_seconds", "histogram", "HTTP request latency in seconds (until the response starts).")
+metrics.describe("assistant_cache_requests_total", "counter", "Cache lookups by cache and result.")
+metrics.describe("assistant_payload_bytes", "histogram", "Size of requests, uploads, contexts and answers.", size_buckets)
+
+
+def stage(name:str):
+    """
+    Time a block as a pipeline stage: `with stage("retrieval"): ...`.
+    """
+    return metrics.timer("assistant_stage_seconds", stage=name)
+
+
+def timed(name:str):
+    """
+    Decorator form of stage().
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def flatten_stats(prefix:str, stats:Optional[Dict]) -> Dict[str, float]:
+    """
+    Numeric entries of a component's stats() dict as gauges named <prefix>_<key>.
+    """
+    return {f"{prefix}_{key}": value for key, value in (stats or {}).items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
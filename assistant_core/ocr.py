@@ -0,0 +1,181 @@
+#page-parallel, streaming OCR for scanned PDFs, backed by a persistent per-page cache
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+from langchain.docstore.document import Document
+from assistant_core.sqlite_cache import SQLiteLRUCache
+from config.logging import doc_handler_logger
+
+
+#OCR settings, overridable through the environment
+ocr_dpi = int(os.getenv("OCR_DPI", "300"))
+ocr_lang = os.getenv("OCR_LANG", "eng")
+ocr_batch_pages = int(os.getenv("OCR_BATCH_PAGES", "8"))
+#OCR threads per process; inside a process pool each worker gets its share of the CPU (see limit_ocr_workers)
+ocr_workers = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+poppler_path = os.getenv("POPPLER_PATH", "/usr/bin")
+
+#OCR output cache shared by directory ingestion and uploads
+ocr_cache_path = os.getenv("OCR_CACHE_PATH", os.path.join("cache", "ocr.sqlite"))
+ocr_cache_max_bytes = int(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def limit_ocr_workers(pool_size:int):
+    """
+    Called in each worker of a process pool of `pool_size` processes: unless OCR_WORKERS is
+    set, OCR gets cpu_count // pool_size threads, so the pool's workers together don't run
+    more tesseract processes than there are CPUs.
+    """
+    global ocr_workers
+    if "OCR_WORKERS" not in os.environ:
+        ocr_workers = max(1, (os.cpu_count() or 2) // max(1, pool_size))
+
+
+def get_ocr_cache() -> SQLiteLRUCache:
+    """
+    Open the OCR cache on first use, once per process (ingestion worker processes open their own).
+    """
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = SQLiteLRUCache(ocr_cache_path, table="ocr_pages", max_bytes=ocr_cache_max_bytes)
+        return _ocr_cache
+
+
+def content_hash(file_path:str) -> str:
+    """
+    sha256 of a file's content, so a re-uploaded file hits the cache whatever its name.
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def ocr_cache_key(digest:str, page, dpi, lang:str) -> str:
+    return f"{digest}:{page}:{dpi}:{lang}"
+
+
+def cached_image_text(file_path:str, extract, lang:str = None) -> str:
+    """
+    Return the OCR text of an image file from the cache, running `extract(file_path)`
+    only on a miss.
+    """
+    key = ocr_cache_key(content_hash(file_path), 0, "image", lang or ocr_lang)
+    cache = get_ocr_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        doc_handler_logger.info(f"OCR cache hit for image {file_path}")
+        return cached.decode("utf-8")
+    text = extract(file_path)
+    cache.set(key, text.encode("utf-8"))
+    return text
+
+
+def pdf_page_count(file_path:str) -> int:
+    """
+    Number of pages in a PDF, read from its metadata without rasterizing anything.
+    """
+    return int(pdfinfo_from_path(file_path, poppler_path=poppler_path)["Pages"])
+
+
+def _ocr_image(image, lang:str) -> str:
+    try:
+        return pytesseract.image_to_string(image, lang=lang)
+    finally:
+        image.close()
+
+
+def _batches(pages:List[int], size:int) -> Iterator[List[int]]:
+    #group sorted 0-based page numbers into runs of consecutive pages, at most `size` long,
+    #so each run can be rasterized with a single pdftoppm call
+    batch: List[int] = []
+    for page in pages:
+        if batch and (len(batch) == size or page != batch[-1] + 1):
+            yield batch
+            batch = []
+        batch.append(page)
+    if batch:
+        yield batch
+
+
+def iter_ocr_pages(file_path:str, pages:Optional[Iterable[int]] = None, dpi:int = None,
+                   lang:str = None, workers:int = None, batch_pages:int = None) -> Iterator[Tuple[int, str]]:
+    """
+    OCR a PDF page by page. Pages are rasterized in bounded batches, so at most
+    `batch_pages` images are held in memory, and the pages of a batch are OCR'd
+    concurrently (Tesseract runs as a separate process per page, so the threads
+    spread the work across cores).
+
+    Args:
+        file_path (str): The path to the PDF file.
+        pages (iterable): 0-based page numbers to OCR, defaults to every page.
+        dpi (int): Rasterization resolution, defaults to OCR_DPI.
+        lang (str): Tesseract language, defaults to OCR_LANG.
+        workers (int): Pages OCR'd at the same time, defaults to OCR_WORKERS.
+        batch_pages (int): Pages rasterized per batch, defaults to OCR_BATCH_PAGES.
+
+    Yields:
+        tuple: (page_number, text) in page order.
+    """
+    dpi = dpi or ocr_dpi
+    lang = lang or ocr_lang
+    workers = workers or ocr_workers
+    batch_pages = batch_pages or ocr_batch_pages
+    pages = sorted(set(pages)) if pages is not None else list(range(pdf_page_count(file_path)))
+
+    #pages OCR'd before (same content, dpi and language) come straight from the cache
+    cache = get_ocr_cache()
+    digest = content_hash(file_path)
+    keys = {page: ocr_cache_key(digest, page, dpi, lang) for page in pages}
+    cached = cache.get_many(keys.values())
+    missing = [page for page in pages if keys[page] not in cached]
+    if len(missing) < len(pages):
+        doc_handler_logger.info(f"OCR cache hit for {len(pages) - len(missing)} of {len(pages)} pages of {file_path}")
+
+    def ocr_missing():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in _batches(missing, batch_pages):
+                images = convert_from_path(file_path, dpi=dpi, first_page=batch[0] + 1, last_page=batch[-1] + 1,
+                                           thread_count=min(workers, len(batch)), poppler_path=poppler_path)
+                texts = list(executor.map(lambda image: _ocr_image(image, lang), images))
+                cache.set_many({keys[page]: text.encode("utf-8") for page, text in zip(batch, texts)})
+                doc_handler_logger.info(f"OCR'd pages {batch[0] + 1}-{batch[-1] + 1} of {file_path}")
+                yield from zip(batch, texts)
+
+    fresh = ocr_missing()
+    for page in pages:
+        if keys[page] in cached:
+            yield page, cached[keys[page]].decode("utf-8")
+        else:
+            yield next(fresh)
+    fresh.close()
+
+
+def ocr_pdf_documents(file_path:str, metadata:dict = None, pages:Optional[Iterable[int]] = None,
+                      dpi:int = None, lang:str = None) -> Iterator[Document]:
+    """
+    Yield one Document per OCR'd page, tagged with its 0-based page number (the same
+    convention PyMuPDFLoader uses) so answers can point back to the page.
+
+    Args:
+        file_path (str): The path to the PDF file.
+        metadata (dict): Metadata copied onto every page, e.g. source and subject.
+        pages (iterable): 0-based page numbers to OCR, defaults to every page.
+        dpi (int): Rasterization resolution, defaults to OCR_DPI.
+        lang (str): Tesseract language, defaults to OCR_LANG.
+
+    Yields:
+        Document: The text of a page that contained any text.
+    """
+    metadata = metadata or {"source": file_path}
+    for page, text in iter_ocr_pages(file_path, pages=pages, dpi=dpi, lang=lang):
+        if text.strip():
+            yield Document(page_content=text, metadata={**metadata, "page": page, "ocr": True})
@@ -0,0 +1,110 @@
+#ONNX Runtime CPU backend for the sentence-transformers embedding model
+import os
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config.logging import embedding_vec_logger
+
+
+def export_onnx(model_name:str, model_dir:str, quantize:bool = False) -> str:
+    """
+    Export the transformer to ONNX once (and optionally quantize its weights to int8) and
+    return the path of the model file. Later calls reuse the exported files.
+
+    Args:
+        model_name (str): Hugging Face model id.
+        model_dir (str): Folder the exported models are written to.
+        quantize (bool): Return the dynamically int8-quantized model.
+
+    Returns:
+        str: Path of the ONNX model.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        embedding_vec_logger.info(f"Exporting {model_name} to ONNX in {model_dir}...")
+        model = AutoModel.from_pretrained(model_name).eval()
+        sample = AutoTokenizer.from_pretrained(model_name)(["export"], return_tensors="pt")
+        inputs = ["input_ids", "attention_mask", "token_type_ids"]
+        temp_path = f"{fp32_path}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in inputs),
+                temp_path,
+                input_names=inputs,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in inputs + ["last_hidden_state"]},
+                opset_version=14,
+            )
+        os.replace(temp_path, fp32_path)
+
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        embedding_vec_logger.info(f"Quantizing {fp32_path} to int8...")
+        temp_path = f"{int8_path}.tmp"
+        quantize_dynamic(fp32_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, int8_path)
+    return int8_path if quantize else fp32_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime on the CPU, a drop-in replacement for
+    HuggingFaceBgeEmbeddings with the same mean pooling and normalization. Texts are
+    sorted by length before batching so every batch pads to similar lengths, and the
+    vectors are returned in the original order.
+
+    Args:
+        model_name (str): Hugging Face model id (its tokenizer is loaded from there too).
+        model_dir (str): Folder for the exported ONNX models.
+        quantize (bool): Use int8-quantized weights (faster, vectors differ very slightly).
+        batch_size (int): Texts per forward pass.
+        threads (int): Intra-op threads of the runtime, 0 for its default (all cores).
+        max_length (int): Tokens per text, longer texts are truncated like in sentence-transformers.
+        query_instruction (str): Prefix added to queries, the same one HuggingFaceBgeEmbeddings uses.
+    """
+
+    def __init__(self, model_name:str, model_dir:str, quantize:bool = False, batch_size:int = 64,
+                 threads:int = 0, max_length:int = 256, query_instruction:str = ""):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.query_instruction = query_instruction
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(export_onnx(model_name, model_dir, quantize), options,
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts:List[str]) -> List[List[float]]:
+        vectors = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            #mean pooling over real tokens, then L2 normalization
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_documents(self, texts:List[str]) -> List[List[float]]:
+        return self._encode([text.replace("\n", " ") for text in texts])
+
+    def embed_query(self, text:str) -> List[float]:
+        return self._encode([self.query_instruction + text.replace("\n", " ")])[0]
@@ -1,40 +1,43 @@
 #implementation for retrieving, conversation awareness and also for prompt engineering
 import os
-from tavily import TavilyClient
+import re
+import time
+import threading
+from collections import OrderedDict
 from langchain.chains.combine_documents import create_stuff_documents_chain 
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain.retrievers import EnsembleRetriever
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
 from dotenv import load_dotenv
-from groq import Groq #language model wrapper for Groq API
-from langchain_groq import ChatGroq
 from config.logging import retriever_prompt_logger
-from assistant_core.embedding_vec import doc_store, build_temp_doc_store
+from assistant_core.streaming import filter_think
+from assistant_core.embedding_vec import get_doc_store, get_session_doc_store, get_embedding_model, get_tokenizer
+from assistant_core.lazy import lazy_singleton
+from assistant_core.web_search import get_web_search, search_error_message
+from assistant_core.lexical_index import get_lexical_index, get_session_lexical_index
+from assistant_core.answer_cache import SemanticAnswerCache
+from assistant_core.conversation_memory import ConversationMemory
+from assistant_core.context_packing import ContextPacker, CrossEncoderReranker
+from assistant_core.metrics import metrics, stage
+from assistant_core.indexer import manifest_path
 
 
 
 load_dotenv() #load environment variables from .env file
 
-# Set up the Groq API key
-groq_api_key = os.getenv("GROQ_API_KEY")
-if not groq_api_key:
-    retriever_prompt_logger.error("GROQ_API_KEY environment variable not set.")
-    raise ValueError("GROQ_API_KEY environment variable not set.")
-
-#set up the Tavily API key 
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-if not tavily_api_key:
-    retriever_prompt_logger.error("TAVILY_API_KEY environment variable not set.")
-    raise ValueError("TAVILY_API_KEY environment variable not set.")
-
-# Initialize the Tavily client for web search
-tavily_client = TavilyClient(tavily_api_key)
-
-#set up the Groq model
-model = ChatGroq(api_key=groq_api_key, model="deepseek-r1-distill-llama-70b", temperature=0.3)
+#the Groq model is created on first use (or by warm_up)
+@lazy_singleton
+def get_model():
+    """
+    The Groq chat model, the API key is checked when it is first needed.
+    """
+    from langchain_groq import ChatGroq
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        retriever_prompt_logger.error("GROQ_API_KEY environment variable not set.")
+        raise ValueError("GROQ_API_KEY environment variable not set.")
+    return ChatGroq(api_key=groq_api_key, model="deepseek-r1-distill-llama-70b", temperature=0.3)
 
 #RAFT Prompting 
 RAFT_prompt = ChatPromptTemplate.from_template("""
@@ -66,130 +69,419 @@ Rules:
 <final, clear explanation or prepared statement>
 """)
 
-#Web search fallback function 
+#Web search fallback function, cached and deduplicated by the web-search layer
 def search_web(query:str, num_results: int = 3):
-    try:
-        results = tavily_client.search(query, max_results=num_results)
-        sources = [result["content"] for result in results["results"]]
-        urls = [result["url"] for result in results["results"]]
-        retriever_prompt_logger.info(f"Web search results for query '{query}': {urls}")
-        combined_content = "\n\n".join(sources)
-        return combined_content, urls
-    except Exception as e:
-        retriever_prompt_logger.error(f"Error occurred during web search: {e}")
-        return "I encountered an error while searching the web. Please try again later.", []
+    with stage("web_search"):
+        return get_web_search().search_sync(query, num_results)
+
+
+def web_results_found(web_content:str, web_urls:list) -> bool:
+    """
+    Whether a web search returned real results, rather than the error placeholder of a failed or timed-out search.
+    """
+    return bool(web_urls) and web_content != search_error_message
+
+
+
+#prompt used to turn a follow-up question into a standalone one before retrieval
+contextualize_prompt = ChatPromptTemplate.from_template("""
+Given the conversation so far and a follow-up question from an accounting student, rewrite the
+follow-up as a standalone question that can be understood without the conversation.
+Do NOT answer it, only return the rewritten question.
+
+Conversation:
+{history}
+
+Follow-up question: {input}
+
+Standalone question:""")
+
+#prompt used when retrieval finds nothing and the answer is built from web results
+web_prompt = ChatPromptTemplate.from_template("""
+    You are an expert accounting tutor. A student has asked a question that is not covered by the course materials.
+    Use only reliable accounting sources (IFRS, IASB, ACCA, ICAN, Investopedia, major textbooks). Always provide the source link in your answer.
+
+    Question: {input}
+    **Web Results**:
+    {context}
+
+    ## Answer:
+    """)
+
+
+def format_history(chat_history:list) -> str:
+    """
+    Render the (role, content) pairs sent by the client as plain conversation lines.
+    """
+    return "\n".join(f"{role}: {content}" for role, content in chat_history)
+
+
+#prompt used to fold older turns of a conversation into its running summary
+summary_prompt = ChatPromptTemplate.from_template("""
+Update the summary of a tutoring conversation with an accounting student. Keep the topics,
+standards, figures and open questions the student may refer back to. Use at most {max_words} words
+and only return the updated summary.
+
+Current summary:
+{summary}
+
+New conversation lines:
+{history}
+
+Updated summary:""")
+
+
+def summarize_history(summary:str, turns:list) -> str:
+    """
+    Fold conversation turns that left the window into the conversation's summary (one LLM call).
+    """
+    chain = summary_prompt | get_model() | StrOutputParser()
+    updated = chain.invoke({"summary": summary or "(empty)", "history": format_history(turns),
+                            "max_words": conversation_summary_words})
+    return re.sub(r"<think>.*?</think>", "", updated, flags=re.DOTALL).strip()
+
+
+#conversation memory kept by the server, clients only send the new question
+conversation_summary_words = int(os.getenv("CONVERSATION_SUMMARY_WORDS", "150"))
+conversation_memory = ConversationMemory(
+    summarize_history,
+    window_turns = int(os.getenv("CONVERSATION_WINDOW_TURNS", "3")),
+    max_tokens = int(os.getenv("CONVERSATION_MAX_TOKENS", "1500")),
+    ttl = float(os.getenv("CONVERSATION_TTL_SECONDS", "86400")),
+    max_conversations = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+)
+
+
+class AssistantPipeline:
+    """
+    Long-lived retrieval and answer pipeline, built once at startup and shared by every
+    request. Each question costs at most one query-rewrite call (only when there is
+    chat history), exactly one retrieval and one generation call; the retrieved
+    documents are passed straight to the answer chain.
+
+    Dense and BM25 retrievers are fused with reciprocal rank fusion (EnsembleRetriever), so
+    exact terms like "IAS 16" are found even when the embedding misses them.
+
+    With a context packer, all fused results are reranked, deduplicated and packed into a
+    token budget before they reach the answer prompt instead of being cut to k per source.
+
+    Args:
+        llm: The chat model used for the rewrite, the answer and the web fallback.
+        doc_store: The course corpus vector store.
+        lexical_index: The course corpus BM25 index, or None for dense retrieval only.
+        k (int): Documents retrieved from each store.
+        lexical_weight (float): RRF weight of the BM25 results relative to the dense ones.
+        packer (ContextPacker): Context assembly stage, or None to pass the top results as they are.
+        max_courses (int): Course filters whose retrievers are kept, least recently used are dropped first.
+    """
+
+    def __init__(self, llm, doc_store, lexical_index = None, k:int = 5, lexical_weight:float = 1.0,
+                 packer:ContextPacker = None, max_courses:int = 64):
+        self.llm = llm
+        self.doc_store = doc_store
+        self.lexical_index = lexical_index
+        self.k = k
+        self.lexical_weight = lexical_weight
+        self.packer = packer
+        self.rewrite_chain = contextualize_prompt | llm | StrOutputParser()
+        self.document_chain = create_stuff_documents_chain(
+            llm=llm,
+            prompt=RAFT_prompt,
+            document_variable_name="context",
+        )
+        self.web_chain = web_prompt | llm | StrOutputParser()
+        #the course comes from the client, so the retrievers kept per course are bounded
+        self.max_courses = max_courses
+        self._base_retrievers: "OrderedDict[str, list]" = OrderedDict()
+        self._retrievers_lock = threading.Lock()
+
+    def base_retrievers(self, course:str = None):
+        """
+        Corpus retrievers (dense, then BM25 if available) with their RRF weights for a course
+        filter, created once per course and reused while the course is among the `max_courses`
+        most recently used.
+        """
+        with self._retrievers_lock:
+            if course in self._base_retrievers:
+                self._base_retrievers.move_to_end(course)
+                return self._base_retrievers[course]
+        search_kwargs = {"k": self.k}
+        if course:
+            search_kwargs["filter"] = {"subject": course}
+        retrievers = [(self.doc_store.as_retriever(
+            search_type="similarity",
+            search_kwargs=search_kwargs
+        ), 1.0)]
+        if self.lexical_index is not None:
+            retrievers.append((self.lexical_index.as_retriever(k=self.k, filter=search_kwargs.get("filter")),
+                               self.lexical_weight))
+        with self._retrievers_lock:
+            self._base_retrievers[course] = retrievers
+            while len(self._base_retrievers) > self.max_courses:
+                self._base_retrievers.popitem(last=False)
+        return retrievers
+
+    def retriever(self, course:str = None, session_store = None, session_lexical = None):
+        """
+        The retriever for one request: the corpus, fused with the session's uploads if any.
+        """
+        retrievers = list(self.base_retrievers(course))
+        if session_store is not None:
+            retrievers.append((session_store.as_retriever(search_kwargs={"k": self.k}), 1.0))
+        if session_lexical is not None:
+            retrievers.append((session_lexical.as_retriever(k=self.k), self.lexical_weight))
+        if len(retrievers) == 1:
+            return retrievers[0][0]
+        return EnsembleRetriever(retrievers=[r for r, _ in retrievers], weights=[w for _, w in retrievers])
+
+    def standalone_question(self, question:str, chat_history:list) -> str:
+        """
+        Rewrite a follow-up question using the chat history, skipped when there is no history.
+        """
+        #the client sends the current question as the last history entry, it is not context
+        history = [turn for turn in chat_history if tuple(turn) != ("user", question)]
+        if not history:
+            return question
+        rewritten = self.rewrite_chain.invoke({"input": question, "history": format_history(history)})
+        #deepseek-r1 prefixes its output with a <think> section that must not reach the retriever
+        rewritten = re.sub(r"<think>.*?</think>", "", rewritten, flags=re.DOTALL).strip()
+        return rewritten or question
+
+    def search(self, search_query:str, course:str = None, session_store = None, session_lexical = None):
+        """
+        Retrieve documents for a question that is already standalone. The fused list is packed
+        into the context budget, or without a packer cut to k documents per searched source
+        (corpus, uploads), as before lexical fusion.
+        """
+        docs = self.retriever(course, session_store, session_lexical).invoke(search_query)
+        if self.packer is not None:
+            return self.packer.pack(search_query, docs)
+        sources = 1 + (session_store is not None or session_lexical is not None)
+        return docs[:self.k * sources]
+
+    def answer_from_web(self, question:str, web_content:str, web_urls:list) -> str:
+        """
+        Answer from the results of a web search that was already run.
+        """
+        answer = self.web_chain.invoke({"input": question, "context": web_content})
+        retriever_prompt_logger.info(f"Web search answer: {answer}")
+        return answer + f"\nSources: {', '.join(web_urls)}"
+
+    def answer(self, question:str, docs, chat_history:list = []) -> str:
+        """
+        Generate the answer from documents that were already retrieved.
+        """
+        return self.document_chain.invoke({"input": question, "context": docs, "history": chat_history})
+
+    def stream_answer(self, question:str, docs, chat_history:list = []):
+        """
+        Same as answer, but yields the answer tokens as the model generates them.
+        """
+        return self.document_chain.stream({"input": question, "context": docs, "history": chat_history})
+
+    def stream_answer_from_web(self, question:str, web_content:str, web_urls:list):
+        yield from self.web_chain.stream({"input": question, "context": web_content})
+        yield f"\nSources: {', '.join(web_urls)}"
+
 
+#context packing: "mmr" (default), "cross-encoder" or "off"
+context_reranker = os.getenv("CONTEXT_RERANKER", "mmr").lower()
+
+
+def build_context_packer():
+    """
+    The context packer configured by the CONTEXT_* settings, or None when packing is off.
+    """
+    if context_reranker == "off":
+        return None
+    if context_reranker not in ("mmr", "cross-encoder"):
+        raise ValueError(f"Unknown CONTEXT_RERANKER {context_reranker}, use 'mmr', 'cross-encoder' or 'off'.")
+    reranker = None
+    if context_reranker == "cross-encoder":
+        reranker = CrossEncoderReranker(os.getenv("CONTEXT_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    return ContextPacker(
+        get_embedding_model(),
+        max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "2000")),
+        reranker = reranker,
+        mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+        duplicate_threshold = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8")),
+        tokenizer = get_tokenizer()
+    )
+
+
+#built once on first use and reused by every request
+@lazy_singleton
+def get_pipeline() -> AssistantPipeline:
+    return AssistantPipeline(get_model(), get_doc_store(), get_lexical_index(),
+                             lexical_weight = float(os.getenv("LEXICAL_WEIGHT", "1.0")),
+                             packer = build_context_packer(),
+                             max_courses = int(os.getenv("COURSE_RETRIEVERS_MAX", "64")))
+
+
+#semantic cache of earlier answers, cleared whenever the indexing job rewrites its manifest
+answer_cache_enabled = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+
+
+@lazy_singleton
+def get_answer_cache() -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        get_embedding_model(),
+        threshold = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+        ttl = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400")),
+        max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+        manifest_path = manifest_path
+    )
+
+
+def warm_up():
+    """
+    Build every model, client and store ahead of the first request and run one query
+    embedding, so the first student does not pay the cold start. Called from the API's
+    lifespan handler.
+    """
+    get_embedding_model().embed_query("warm up")
+    get_pipeline()
+    get_web_search()
+    if answer_cache_enabled:
+        get_answer_cache()
+    lexical = get_lexical_index()
+    if lexical is not None:
+        lexical.search("warm up", k=1)
+
+
+def lookup_answer_cache(answer_cache, search_query:str, scope:str):
+    """
+    Look up the semantic answer cache, recording the lookup time and whether it hit.
+    """
+    if answer_cache is None:
+        return None
+    with stage("answer_cache"):
+        cached = answer_cache.lookup(search_query, scope)
+    metrics.inc("assistant_cache_requests_total", cache="answer", result="hit" if cached is not None else "miss")
+    return cached
+
+
+def cached_or_standalone(pipeline:AssistantPipeline, answer_cache, question:str, chat_history:list, scope:str):
+    """
+    Resolve the search query and look it up in the answer cache. A first question is looked
+    up as asked (no rewrite is needed); a follow-up only once the rewrite has made it standalone,
+    since "can you give an example?" means something different in every conversation.
+
+    Returns:
+        tuple: (search query, cached answer or None).
+    """
+    with stage("rewrite"):
+        search_query = pipeline.standalone_question(question, chat_history)
+    return search_query, lookup_answer_cache(answer_cache, search_query, scope)
+
+
+def retrieve_documents(pipeline:AssistantPipeline, search_query:str, course:str, session_store, session_lexical):
+    """
+    Run retrieval as a timed stage and record how much context it produced.
+    """
+    with stage("retrieval"):
+        docs = pipeline.search(search_query, course, session_store, session_lexical)
+    metrics.observe("assistant_payload_bytes", sum(len(d.page_content) for d in docs), kind="context_chars")
+    return docs
 
 
 #main function to handle the retrieval and response generation
-def ask_assistant(question:str, course:str = None, chat_history:list = [], uploaded_docs: list = []):
+def ask_assistant(question:str, course:str = None, chat_history:list = [], uploaded_docs: list = [], session_id:str = None):
     try:
-        #setup retriever with course filter
-        if course:
-            base_retriever = doc_store.as_retriever(
-                search_kwargs={"filter": {"subject": course}},
-                search_type="similarity",
-                k=5  #retrieve top 5 relevant documents
-            )
-        else:
-            base_retriever = doc_store.as_retriever(k=5)  #retrieve top 5 relevant documents without course filter
+        start = time.perf_counter()
+        pipeline = get_pipeline()
+        answer_cache = get_answer_cache() if answer_cache_enabled else None
         retriever_prompt_logger.info(f"Retrieving documents for question: {question} with course: {course}")
-        
-        #list of retrievers to combine
-        retrievers = [base_retriever]
-
-        #add temporary user-uploaded document retriever if available
-        temp_doc_store = build_temp_doc_store(uploaded_docs) 
-        if temp_doc_store:
-            retrievers.append(temp_doc_store.as_retriever(k = 5))
-
-        #combine retrievers using EnsembleRetriever
-        combine_retriever = EnsembleRetriever(retrievers=retrievers, weights=[1]*len(retrievers))
-        
-        retriever_prompt_logger.info("Combined retrievers successfully.")
-        
-        #wrap the retriever with history awareness
+        #the session's user-uploaded document store if available (built once per session)
+        with stage("session_store"):
+            session_store = get_session_doc_store(session_id, uploaded_docs)
+            session_lexical = get_session_lexical_index(session_id, uploaded_docs)
+
         try:
-            history_aware_retriever = create_history_aware_retriever(
-                retriever=combine_retriever,
-                # history_length=5,  #number of previous interactions to consider
-                llm=model,  #use the Groq model for retrieval
-                prompt=ChatPromptTemplate.from_template(
-                    "You are an expert accounting tutor. "
-                    "Answer the question based on the provided context: {context} "
-                    "Question: {input}"
-                )
-            )
-            retriever_prompt_logger.info("History-aware retriever created successfully.")
+            scope = SemanticAnswerCache.scope(course, session_id, session_store is not None)
+            search_query, cached = cached_or_standalone(pipeline, answer_cache, question, chat_history, scope)
+            if cached is not None:
+                return cached
+            retrieved_docs = retrieve_documents(pipeline, search_query, course, session_store, session_lexical)
         except Exception as e:
-            retriever_prompt_logger.error(f"Error creating history-aware retriever: {e}")
+            retriever_prompt_logger.error(f"Error retrieving documents: {e}")
             return "Sorry, an error occurred while setting up the retriever."
-
-        #retrieve relevant documents
-        retrieved_docs = history_aware_retriever.invoke(
-            {"input": question, "history": chat_history}
-        )
         retriever_prompt_logger.info(f"Retrieved {len(retrieved_docs)} documents for question: {question}")
 
         if not retrieved_docs:
             retriever_prompt_logger.warning("No relevant documents found. Searching the web for answers.")
             try:
                 web_content, web_urls = search_web(question)
-                web_prompt = ChatPromptTemplate.from_template("""
-    You are an expert accounting tutor. A student has asked a question that is not covered by the course materials.
-    Use only reliable accounting sources (IFRS, IASB, ACCA, ICAN, Investopedia, major textbooks). Always provide the source link in your answer.
-
-    Question: {input}
-    **Web Results**:
-    {context}
-
-    ## Answer:
-    """)
-                answer = model.invoke(
-                    web_prompt.format(input=question, context=web_content)
-                ).content
-                retriever_prompt_logger.info(f"Web search answer: {answer}")
-                return answer + f"\nSources: {', '.join(web_urls)}"
+                #a failed search must not be cached as the answer to this question
+                cacheable = web_results_found(web_content, web_urls)
+                with stage("web_answer"):
+                    answer = pipeline.answer_from_web(question, web_content, web_urls)
             except Exception as e:
                 retriever_prompt_logger.error(f"Error during web search: {e}")
                 return "Sorry, I couldn't find any relevant information online. Please try again later."
-            
-        #create document chain for retrieval
-        try:
-            retriever_prompt_logger.info("Creating document chain for retrieval.")
-            document_chain = create_stuff_documents_chain(
-                llm=model,
-                prompt=RAFT_prompt,
-                document_variable_name="context",
-            )
-            retriever_prompt_logger.info("Document chain created successfully.")
-        except Exception as e:
-            retriever_prompt_logger.error(f"Error creating document chain: {e}")
-            return "Sorry, an error occurred while setting up the document chain."
+        else:
+            cacheable = True
+            #generate the answer from the documents retrieved above
+            try:
+                with stage("generation"):
+                    answer = pipeline.answer(question, retrieved_docs, chat_history)
+            except Exception as e:
+                retriever_prompt_logger.error(f"Error invoking final retrieval chain for a response: {e}")
+                return "Sorry, an error occurred while generating a response."
 
-        #create the FINAL retrieval chain
-        try:
-            retriever_prompt_logger.info("Creating retrieval chain.")
-            retrieval_chain = create_retrieval_chain(
-                retriever=history_aware_retriever,
-                combine_docs_chain=document_chain,
-                #return_source_documents=True
-            )
-
-            retriever_prompt_logger.info("Retrieval chain created successfully.")
-        except Exception as e:
-            retriever_prompt_logger.error(f"Error creating retrieval chain: {e}")
-            return "Sorry, an error occurred while setting up the retrieval chain." 
-        
-        #invoke the retrieval chain with the question and chat history
-        try:
-            response = retrieval_chain.invoke(
-                {"input": question, "history": chat_history}
-            )
-            return response["answer"]
-        except Exception as e:
-            retriever_prompt_logger.error(f"Error invoking final retrieval chain for a response: {e}")
-            return "Sorry, an error occurred while generating a response."
+        if answer_cache and cacheable and answer.strip():
+            answer_cache.store(search_query, scope, answer, time.perf_counter() - start)
+        return answer
     except Exception as e:
         retriever_prompt_logger.error(f"Error in ask_assistant: {e}")
-        return "Sorry, an error occurred while processing your request."
\ No newline at end of file
+        return "Sorry, an error occurred while processing your request."
+
+
+#streaming variant of ask_assistant, yields the visible answer as it is generated
+def ask_assistant_stream(question:str, course:str = None, chat_history:list = [], uploaded_docs: list = [], session_id:str = None):
+    """
+    Retrieve once, then stream the answer tokens with the model's <think> section filtered out
+    incrementally, so the student sees the first words of the answer as soon as they exist.
+    """
+    try:
+        start = time.perf_counter()
+        pipeline = get_pipeline()
+        answer_cache = get_answer_cache() if answer_cache_enabled else None
+        retriever_prompt_logger.info(f"Retrieving documents for streamed question: {question} with course: {course}")
+        with stage("session_store"):
+            session_store = get_session_doc_store(session_id, uploaded_docs)
+            session_lexical = get_session_lexical_index(session_id, uploaded_docs)
+        scope = SemanticAnswerCache.scope(course, session_id, session_store is not None)
+        search_query, cached = cached_or_standalone(pipeline, answer_cache, question, chat_history, scope)
+        if cached is not None:
+            yield from filter_think([cached])
+            return
+
+        retrieved_docs = retrieve_documents(pipeline, search_query, course, session_store, session_lexical)
+        retriever_prompt_logger.info(f"Retrieved {len(retrieved_docs)} documents for question: {question}")
+
+        if not retrieved_docs:
+            retriever_prompt_logger.warning("No relevant documents found. Searching the web for answers.")
+            web_content, web_urls = search_web(question)
+            cacheable = web_results_found(web_content, web_urls)
+            chunks = pipeline.stream_answer_from_web(question, web_content, web_urls)
+            generation = "web_answer"
+        else:
+            cacheable = True
+            chunks = pipeline.stream_answer(question, retrieved_docs, chat_history)
+            generation = "generation"
+        #the time the student waits for the first visible token, then the whole generation
+        generation_start = time.perf_counter()
+        visible = []
+        for token in filter_think(chunks):
+            if not visible:
+                metrics.observe("assistant_stage_seconds", time.perf_counter() - generation_start, stage="first_token")
+            visible.append(token)
+            yield token
+        metrics.observe("assistant_stage_seconds", time.perf_counter() - generation_start, stage=generation)
+        answer = "".join(visible)
+        if answer_cache and cacheable and answer.strip():
+            answer_cache.store(search_query, scope, answer, time.perf_counter() - start)
+    except Exception as e:
+        retriever_prompt_logger.error(f"Error in ask_assistant_stream: {e}")
+        yield "Sorry, an error occurred while processing your request."
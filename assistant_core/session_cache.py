@@ -0,0 +1,111 @@
+#in-memory, session-keyed cache with TTL and a global memory budget
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class SessionCache:
+    """
+    Keeps one value per session id, evicting entries that were not used for `ttl`
+    seconds and, least-recently-used first, entries that push the total estimated
+    size over `max_bytes`.
+
+    Args:
+        ttl (float): Seconds an entry may stay idle before it expires.
+        max_bytes (int): Global budget for the estimated size of all entries.
+        on_evict (callable): Called with (session_id, value, reason) whenever an entry leaves
+            the cache, reason being "expired", "evicted" (over budget) or "removed".
+    """
+
+    def __init__(self, ttl:float, max_bytes:int, on_evict:Optional[Callable[[str, Any, str], None]] = None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, list]" = OrderedDict()  #session_id -> [value, size, last_access]
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, session_id:str) -> Any:
+        """
+        Return the cached value for a session, or None if it is missing or expired.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry[2] = time.monotonic()
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, session_id:str) -> Any:
+        """
+        Return the cached value without refreshing it or touching the counters.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry[0] if entry else None
+
+    def put(self, session_id:str, value:Any, size:int):
+        """
+        Cache a value for a session together with its estimated size in bytes.
+        """
+        with self._lock:
+            existing = self._entries.get(session_id)
+            if existing is not None and existing[0] is value:
+                #the same object grew (e.g. more chunks were added), only its size changes
+                self._bytes -= existing[1]
+                del self._entries[session_id]
+            elif existing is not None:
+                self._remove(session_id, "removed")
+            self._entries[session_id] = [value, size, time.monotonic()]
+            self._bytes += size
+            self._expire()
+            #always keep the newest entry, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)), "evicted")
+
+    def pop(self, session_id:str):
+        """
+        Drop a session from the cache.
+        """
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id, "removed")
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, entry in self._entries.items() if now - entry[2] > self.ttl]:
+            self._remove(session_id, "expired")
+
+    def _remove(self, session_id:str, reason:str):
+        value, size, _ = self._entries.pop(session_id)
+        self._bytes -= size
+        if reason != "removed":
+            self.evictions += 1
+        if self.on_evict:
+            self.on_evict(session_id, value, reason)
+
+    def __contains__(self, session_id:str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Resident sessions, estimated bytes and hit/miss counters.
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
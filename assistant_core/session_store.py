@@ -0,0 +1,195 @@
+#bounded store for the documents students upload, with optional spill to disk
+import os
+import re
+import json
+import gzip
+import time
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from assistant_core.session_cache import SessionCache
+from config.logging import fastapi_app_logger
+
+#session ids come from clients, only these ever map to a file in the spill folder
+spillable_session_id = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def estimate_docs_bytes(docs:List[Document]) -> int:
+    """
+    Rough resident size of a list of parsed documents: their text plus a fixed
+    overhead for the Document object and its metadata.
+    """
+    return sum(len(doc.page_content.encode("utf-8")) + 512 for doc in docs)
+
+
+class SessionStore:
+    """
+    Keeps the parsed documents of every upload session in memory under a per-session
+    idle TTL and a global byte budget, evicting the least recently used sessions first.
+
+    When `spill_dir` is set, sessions pushed out by the byte budget are not lost: their
+    documents (gzip-compressed JSON) and chunk embeddings (raw float32) are written to
+    disk and transparently loaded back on the session's next query. Sessions that
+    simply expired are deleted, and spilled sessions that are not queried again are
+    removed once they pass the same TTL (checked at most every `cleanup_interval` seconds
+    as sessions are added or spilled).
+
+    Args:
+        ttl (float): Seconds a session may stay idle before it is dropped.
+        max_bytes (int): Global budget for the documents kept in memory.
+        spill_dir (str): Folder for spilled sessions, or None to disable spilling.
+        export_embeddings (callable): Returns (texts, vectors) of a session's chunk embeddings.
+        import_embeddings (callable): Receives (texts, vectors) when a spilled session is loaded back.
+        cleanup_interval (float): Minimum seconds between two scans of the spill folder.
+    """
+
+    def __init__(self, ttl:float, max_bytes:int, spill_dir:Optional[str] = None,
+                 export_embeddings:Optional[Callable[[str], Tuple[List[str], List[List[float]]]]] = None,
+                 import_embeddings:Optional[Callable[[List[str], List[List[float]]], None]] = None,
+                 cleanup_interval:float = 60):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.spill_dir = spill_dir
+        self.export_embeddings = export_embeddings
+        self.import_embeddings = import_embeddings
+        self.spills = 0
+        self.restores = 0
+        self._lock = threading.RLock()
+        self._cache = SessionCache(ttl=ttl, max_bytes=max_bytes, on_evict=self._on_evict)
+        self._next_cleanup = 0.0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def append(self, session_id:str, docs:List[Document]) -> List[Document]:
+        """
+        Add documents to a session (e.g. as the files of an upload finish parsing).
+
+        Returns:
+            List[Document]: Every document of the session so far.
+        """
+        with self._lock:
+            all_docs = (self.get(session_id) or []) + list(docs)
+            self._cache.put(session_id, all_docs, estimate_docs_bytes(all_docs))
+            self._cleanup_spill()
+            return all_docs
+
+    def get(self, session_id:str, default:Optional[List[Document]] = None) -> Optional[List[Document]]:
+        """
+        Return the documents of a session, loading them back from disk if they were spilled.
+        """
+        if not session_id:
+            return default
+        with self._lock:
+            docs = self._cache.get(session_id)
+            if docs is None:
+                docs = self._restore(session_id)
+            return docs if docs is not None else default
+
+    #spilling
+    def _spillable(self, session_id:str) -> bool:
+        return bool(self.spill_dir) and spillable_session_id.fullmatch(session_id or "") is not None
+
+    def _spill_paths(self, session_id:str) -> Tuple[str, str]:
+        base = os.path.join(self.spill_dir or "", session_id)
+        return f"{base}.docs.json.gz", f"{base}.emb.f32"
+
+    def _on_evict(self, session_id:str, docs:List[Document], reason:str):
+        if reason != "evicted" or not self.spill_dir:
+            if reason == "expired":
+                fastapi_app_logger.info(f"Upload session {session_id} expired.")
+            return
+        try:
+            texts, vectors = self.export_embeddings(session_id) if self.export_embeddings else ([], [])
+            docs_path, emb_path = self._spill_paths(session_id)
+            payload = {
+                "docs": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+                "chunks": texts,
+                "dim": len(vectors[0]) if vectors else 0,
+            }
+            with gzip.open(docs_path, "wt", encoding="utf-8") as f:
+                json.dump(payload, f)
+            vector_data = array("f")
+            for vector in vectors:
+                vector_data.extend(vector)
+            with open(emb_path, "wb") as f:
+                vector_data.tofile(f)
+            self.spills += 1
+            fastapi_app_logger.info(f"Spilled upload session {session_id} to disk ({len(docs)} documents, {len(vectors)} embeddings).")
+        except Exception as e:
+            fastapi_app_logger.error(f"Error spilling upload session {session_id}: {e}")
+        self._cleanup_spill()
+
+    def _restore(self, session_id:str) -> Optional[List[Document]]:
+        if not self._spillable(session_id):
+            return None
+        docs_path, emb_path = self._spill_paths(session_id)
+        if not os.path.exists(docs_path):
+            return None
+        if time.time() - os.path.getmtime(docs_path) > self.ttl:
+            self._delete_spill(session_id)
+            return None
+        try:
+            with gzip.open(docs_path, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+            docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["docs"]]
+
+            #hand the spilled chunk embeddings back so rebuilding the session's store skips encoding
+            dim = payload.get("dim", 0)
+            if dim and self.import_embeddings and os.path.exists(emb_path):
+                vector_data = array("f")
+                with open(emb_path, "rb") as f:
+                    vector_data.frombytes(f.read())
+                vectors = [vector_data[i:i + dim].tolist() for i in range(0, len(vector_data), dim)]
+                self.import_embeddings(payload["chunks"], vectors)
+
+            self._delete_spill(session_id)
+            self._cache.put(session_id, docs, estimate_docs_bytes(docs))
+            self.restores += 1
+            fastapi_app_logger.info(f"Restored upload session {session_id} from disk.")
+            return docs
+        except Exception as e:
+            fastapi_app_logger.error(f"Error restoring upload session {session_id}: {e}")
+            return None
+
+    def _delete_spill(self, session_id:str):
+        if not self._spillable(session_id):
+            return
+        for path in self._spill_paths(session_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _cleanup_spill(self):
+        #spilled sessions expire on the same idle TTL as resident ones
+        now = time.time()
+        if not self.spill_dir or now < self._next_cleanup:
+            return
+        self._next_cleanup = now + self.cleanup_interval
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError as e:
+                fastapi_app_logger.error(f"Error removing expired spill file {path}: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Resident sessions and bytes, plus spilled sessions and their size on disk.
+        """
+        stats = self._cache.stats()
+        spilled_sessions, spilled_bytes = 0, 0
+        if self.spill_dir:
+            for name in os.listdir(self.spill_dir):
+                spilled_bytes += os.path.getsize(os.path.join(self.spill_dir, name))
+                spilled_sessions += name.endswith(".docs.json.gz")
+        return {
+            "resident_sessions": stats["sessions"],
+            "resident_bytes": stats["bytes"],
+            "max_bytes": stats["max_bytes"],
+            "evictions": stats["evictions"],
+            "spilled_sessions": spilled_sessions,
+            "spilled_bytes": spilled_bytes,
+            "spills": self.spills,
+            "restores": self.restores,
+        }
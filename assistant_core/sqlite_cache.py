@@ -0,0 +1,148 @@
+#size-bounded LRU cache persisted in SQLite, shared by the embedding and OCR caches
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+class SQLiteLRUCache:
+    """
+    A persistent key -> bytes cache stored in a single SQLite file.
+
+    Entries are evicted least-recently-used first once the stored values exceed
+    `max_bytes`. The file can be shared by several processes (the indexing job and
+    the API workers), SQLite's WAL mode takes care of concurrent readers and writers.
+    """
+
+    def __init__(self, path:str, table:str = "cache", max_bytes:int = 512 * 1024 * 1024):
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+    def get(self, key:str) -> Optional[bytes]:
+        """
+        Return the value stored under `key`, or None on a miss.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys:Iterable[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys at once and refresh their position in the LRU order.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            #sqlite limits the number of bound parameters, so query in slices
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", batch
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE {self.table} SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time(), *[row[0] for row in rows]],
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key:str, value:bytes):
+        """
+        Store a single value.
+        """
+        self.set_many({key: value})
+
+    def set_many(self, items:Dict[str, bytes]):
+        """
+        Store several values and evict the least recently used entries if the cache is over budget.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            keys = list(items)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                replaced = self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self.table} WHERE key IN ({marks})", batch
+                ).fetchone()[0]
+                self._size -= replaced
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, sqlite3.Binary(value), len(value), now) for key, value in items.items()],
+            )
+            self._size += sum(len(value) for value in items.values())
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        #other processes may have written to the same file, so re-read the real size first
+        if self._size > self.max_bytes:
+            self._size = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        #drop the oldest entries in slices until the cache fits its byte budget again
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            budget = self._size - self.max_bytes
+            victims: List[str] = []
+            for key, size in rows:
+                victims.append(key)
+                self._size -= size
+                budget -= size
+                if budget <= 0:
+                    break
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ({','.join('?' * len(victims))})", victims
+            )
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit/miss counters and the current size of the cache.
+        """
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
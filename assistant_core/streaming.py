@@ -0,0 +1,93 @@
+#incremental filtering of the model's <think> section for streamed answers
+import json
+
+
+class ThinkFilter:
+    """
+    Streaming state machine that drops <think>...</think> spans from model output
+    as it is generated. Tags split across chunks are held back until they can be
+    recognized, and leading whitespace of the visible answer is trimmed, matching
+    the non-streaming regex cleanup. Like that regex, a <think> that is never closed
+    is not removed: its text is held back and released by flush.
+    """
+
+    open_tag = "<think>"
+    close_tag = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._thinking = False
+        self._started = False
+        #text of the current think span, only dropped once its closing tag arrives
+        self._held = ""
+
+    def feed(self, text:str) -> str:
+        """
+        Consume the next chunk of model output and return the part that is visible to the student.
+        """
+        self._buffer += text
+        visible = []
+        while True:
+            tag = self.close_tag if self._thinking else self.open_tag
+            index = self._buffer.find(tag)
+            if index != -1:
+                if not self._thinking:
+                    visible.append(self._buffer[:index])
+                self._held = ""
+                self._buffer = self._buffer[index + len(tag):]
+                self._thinking = not self._thinking
+                continue
+            #hold back a trailing partial tag, e.g. "<thi", until the next chunk arrives
+            keep = self._partial_tag_length(tag)
+            if self._thinking:
+                self._held += self._buffer[:len(self._buffer) - keep]
+            else:
+                visible.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return self._trim("".join(visible))
+
+    def flush(self) -> str:
+        """
+        Return whatever is still buffered once the model has finished. An unterminated think
+        span is returned with its opening tag, as the regex cleanup leaves it in place.
+        """
+        rest = self.open_tag + self._held + self._buffer if self._thinking else self._buffer
+        self._buffer = ""
+        self._held = ""
+        self._thinking = False
+        return self._trim(rest)
+
+    def _partial_tag_length(self, tag:str) -> int:
+        for length in range(min(len(tag) - 1, len(self._buffer)), 0, -1):
+            if self._buffer.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _trim(self, text:str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+def filter_think(chunks):
+    """
+    Wrap a stream of model output chunks and yield only the visible answer text.
+    """
+    think_filter = ThinkFilter()
+    for chunk in chunks:
+        visible = think_filter.feed(chunk)
+        if visible:
+            yield visible
+    rest = think_filter.flush()
+    if rest:
+        yield rest
+
+
+def sse_event(data:dict, event:str = None) -> str:
+    """
+    Encode one server-sent event, JSON payloads keep newlines inside tokens intact.
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
@@ -0,0 +1,158 @@
+#background processing of uploads with per-file progress
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from assistant_core.doc_handler import load_uploaded_file
+from assistant_core.embedding_vec import add_to_session_doc_store, prune_session_locks, session_lock
+from assistant_core.session_store import SessionStore
+from assistant_core.metrics import metrics, stage
+from assistant_core.workers import run_cpu, run_io
+from config.logging import fastapi_app_logger, request_id
+
+
+class UploadJob:
+    """
+    Progress of one upload: the session it fills and the state of every file in it.
+    """
+
+    def __init__(self, session_id:str, filenames:List[str]):
+        self.session_id = session_id
+        #id of the upload request, so the background processing logs under it
+        self.request_id = request_id.get()
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.files = [
+            {"filename": name, "status": "queued", "pages_parsed": 0, "pages_ocr": 0,
+             "chunks_embedded": 0, "error": None}
+            for name in filenames
+        ]
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "status": self.status,
+            "files": self.files,
+            "files_ready": sum(f["status"] == "done" for f in self.files),
+            "files_total": len(self.files),
+        }
+
+
+class UploadJobQueue:
+    """
+    Queue of upload jobs processed by a few background tasks. Every file of a job is
+    parsed in the process pool and embedded into the session's vector store as soon as
+    it is ready, so the session can be queried before the whole upload is done.
+
+    Args:
+        session_store (SessionStore): Where the parsed documents of each session are kept.
+        workers (int): Number of jobs processed at the same time.
+        ttl (float): Seconds a finished job's status stays available.
+    """
+
+    def __init__(self, session_store:SessionStore, workers:int = 2, ttl:float = 3600):
+        self.session_store = session_store
+        self.workers = workers
+        self.ttl = ttl
+        self.jobs: Dict[str, UploadJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """
+        Start the background tasks, called from the FastAPI lifespan handler.
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, session_id:str, files:List[Tuple[str, bytes]]) -> UploadJob:
+        """
+        Queue the files of an upload and return its job right away.
+        """
+        self._prune()
+        job = UploadJob(session_id, [name for name, _ in files])
+        self.jobs[session_id] = job
+        self._queue.put_nowait((job, files))
+        return job
+
+    def get(self, session_id:str) -> Optional[UploadJob]:
+        return self.jobs.get(session_id)
+
+    def _prune(self):
+        now = time.time()
+        for session_id in [sid for sid, job in self.jobs.items()
+                           if job.finished_at and now - job.finished_at > self.ttl]:
+            del self.jobs[session_id]
+        #session build locks are kept while a vector store or an upload job still refers to the session
+        prune_session_locks(lambda session_id: session_id in self.jobs)
+
+    async def _worker(self):
+        while True:
+            job, files = await self._queue.get()
+            try:
+                await self._process(job, files)
+            except Exception as e:
+                job.status = "failed"
+                fastapi_app_logger.error(f"Upload job {job.session_id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    async def _process(self, job:UploadJob, files:List[Tuple[str, bytes]]):
+        request_id.set(job.request_id)
+        job.status = "processing"
+        await asyncio.gather(*[self._process_file(job, index, name, content)
+                               for index, (name, content) in enumerate(files)])
+        done = sum(f["status"] == "done" for f in job.files)
+        job.status = "done" if done == len(job.files) else ("partial" if done else "failed")
+        fastapi_app_logger.info(f"Upload job {job.session_id} finished: {done}/{len(job.files)} files ready.")
+
+    async def _process_file(self, job:UploadJob, index:int, filename:str, content:bytes):
+        progress = job.files[index]
+        try:
+            progress["status"] = "parsing"
+            metrics.observe("assistant_payload_bytes", len(content), kind="upload_file")
+            with stage("upload_parse"):
+                docs = await run_cpu("parse", load_uploaded_file, filename, content)
+            progress["pages_parsed"] = len(docs)
+            progress["pages_ocr"] = sum(1 for d in docs if d.metadata.get("ocr"))
+            if not docs:
+                progress["status"] = "failed"
+                progress["error"] = "No text could be extracted from this file."
+                return
+
+            progress["status"] = "embedding"
+
+            def on_progress(chunks:int):
+                progress["chunks_embedded"] = chunks
+
+            await run_io("embed", self._embed_and_publish, job.session_id, docs, on_progress)
+            progress["status"] = "done"
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            fastapi_app_logger.error(f"Error processing {filename} of upload job {job.session_id}: {e}")
+
+    def _embed_and_publish(self, session_id:str, docs:List, on_progress):
+        """
+        Embed one file's documents into the session's vector store, then publish them in the
+        session store. Files of a session go through this one at a time, so a store that has to
+        be rebuilt always sees every document published so far, and a sibling file is never lost.
+        Runs in the thread pool: session store reads and writes may restore or spill sessions on disk.
+        """
+        with session_lock(session_id):
+            all_docs = self.session_store.get(session_id, []) + docs
+            #embed before publishing the documents, so a query never rebuilds the store from them twice
+            add_to_session_doc_store(session_id, docs, all_docs, on_progress)
+            self.session_store.append(session_id, docs)
+
+
+#number of uploads processed at the same time
+upload_job_workers = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
@@ -0,0 +1,185 @@
+#async web-search layer for the fallback: timeout, TTL cache and single-flight deduplication
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from assistant_core.lazy import lazy_singleton
+from config.logging import retriever_prompt_logger
+
+
+#returned when the search fails or times out, never cached
+search_error_message = "I encountered an error while searching the web. Please try again later."
+
+
+def normalize_query(query:str) -> str:
+    """
+    Cache key of a query: case, surrounding punctuation and whitespace do not matter.
+    """
+    return " ".join(query.casefold().split()).strip(" ?!.")
+
+
+class TavilySearchProvider:
+    """
+    Web search through Tavily's async client.
+    """
+
+    name = "tavily"
+
+    def __init__(self, api_key:str):
+        from tavily import AsyncTavilyClient
+        self.client = AsyncTavilyClient(api_key)
+
+    async def search(self, query:str, num_results:int) -> Tuple[str, List[str]]:
+        results = await self.client.search(query, max_results=num_results)
+        sources = [result["content"] for result in results["results"]]
+        urls = [result["url"] for result in results["results"]]
+        return "\n\n".join(sources), urls
+
+
+class StubSearchProvider:
+    """
+    Offline provider for tests and local runs: answers from a JSON file mapping normalized
+    queries to {"content": ..., "urls": [...]}, or with a fixed placeholder result.
+
+    Args:
+        path (str): Optional JSON file with canned results.
+        delay (float): Seconds each search pretends to take.
+    """
+
+    name = "stub"
+
+    def __init__(self, path:str = None, delay:float = 0.0):
+        self.delay = delay
+        self.results = {}
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                self.results = {normalize_query(q): r for q, r in json.load(f).items()}
+        self.calls = 0
+
+    async def search(self, query:str, num_results:int) -> Tuple[str, List[str]]:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        result = self.results.get(normalize_query(query))
+        if result:
+            return result["content"], result["urls"][:num_results]
+        return f"No web results are available offline for: {query}", ["https://example.com/offline-search"]
+
+
+class WebSearch:
+    """
+    Caches web-search results per normalized query for `ttl` seconds and makes identical
+    concurrent searches share one provider call (single-flight), so a burst of the same
+    question triggers a single request. Every search runs on one background event loop
+    thread; synchronous callers (the pipeline, which runs in worker threads) use `search_sync`.
+
+    Args:
+        provider: Object with an async search(query, num_results) -> (content, urls).
+        timeout (float): Seconds a provider call may take before it is abandoned.
+        ttl (float): Seconds a result stays cached.
+        max_entries (int): Cached queries kept, least recently used evicted first.
+    """
+
+    def __init__(self, provider, timeout:float = 8.0, ttl:float = 86400, max_entries:int = 2000):
+        self.provider = provider
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, str, List[str]]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def search(self, query:str, num_results:int = 3) -> Tuple[str, List[str]]:
+        """
+        Return (combined content, urls) for a query, from the cache when possible.
+        Must run on the instance's event loop (search_sync takes care of that).
+        """
+        key = (normalize_query(query), num_results)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[1], cached[2]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, query, num_results))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key:Tuple[str, int], query:str, num_results:int) -> Tuple[str, List[str]]:
+        try:
+            content, urls = await asyncio.wait_for(self.provider.search(query, num_results), self.timeout)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            retriever_prompt_logger.error(f"Web search timed out after {self.timeout}s for query '{query}'.")
+            return search_error_message, []
+        except Exception as e:
+            self.failures += 1
+            retriever_prompt_logger.error(f"Error occurred during web search: {e}")
+            return search_error_message, []
+        retriever_prompt_logger.info(f"Web search results for query '{query}': {urls}")
+        self._cache[key] = (time.monotonic(), content, urls)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return content, urls
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="web-search", daemon=True).start()
+            return self._loop
+
+    def search_sync(self, query:str, num_results:int = 3) -> Tuple[str, List[str]]:
+        """
+        Blocking variant of search for worker threads.
+        """
+        return asyncio.run_coroutine_threadsafe(self.search(query, num_results), self._event_loop()).result()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "provider": self.provider.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "entries": len(self._cache),
+        }
+
+
+@lazy_singleton
+def get_web_search() -> WebSearch:
+    """
+    The web search used by the fallback, provider chosen with WEB_SEARCH_PROVIDER (tavily or stub).
+    """
+    provider_name = os.getenv("WEB_SEARCH_PROVIDER", "tavily").lower()
+    if provider_name == "stub":
+        provider = StubSearchProvider(os.getenv("WEB_SEARCH_STUB_PATH") or None,
+                                      delay = float(os.getenv("WEB_SEARCH_STUB_DELAY", "0")))
+    elif provider_name == "tavily":
+        tavily_api_key = os.getenv("TAVILY_API_KEY")
+        if not tavily_api_key:
+            retriever_prompt_logger.error("TAVILY_API_KEY environment variable not set.")
+            raise ValueError("TAVILY_API_KEY environment variable not set.")
+        provider = TavilySearchProvider(tavily_api_key)
+    else:
+        raise ValueError(f"Unknown WEB_SEARCH_PROVIDER {provider_name}, use 'tavily' or 'stub'.")
+    return WebSearch(provider,
+                     timeout = float(os.getenv("WEB_SEARCH_TIMEOUT_SECONDS", "8")),
+                     ttl = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "86400")),
+                     max_entries = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "2000")))
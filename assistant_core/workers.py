@@ -0,0 +1,125 @@
+#worker pools that keep blocking work off the FastAPI event loop
+import os
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict
+from config.logging import init_worker_logging, worker_log_queue
+
+
+#pool sizes and per-stage concurrency limits, overridable through the environment
+cpu_workers = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+io_workers = int(os.getenv("IO_WORKERS", "32"))
+stage_limits = {
+    "parse": int(os.getenv("PARSE_CONCURRENCY", str(cpu_workers))),  #PDF parsing and OCR of uploads
+    "embed": int(os.getenv("EMBED_CONCURRENCY", "2")),               #building session vector stores
+    "query": int(os.getenv("QUERY_CONCURRENCY", "16")),              #retrieval, Pinecone and Groq calls
+    #any other stage (e.g. "session": upload session reads, spills and restores) is bounded by IO_WORKERS
+}
+
+_cpu_executor = None
+_io_executor = None
+_executor_lock = threading.Lock()
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def init_cpu_worker(worker_queue, pool_size:int):
+    """
+    Process pool initializer: send the worker's log records to the main process and give
+    its OCR threads the worker's share of the CPU.
+    """
+    init_worker_logging(worker_queue)
+    #imported here, the pool's workers parse documents anyway but the API's other users don't need OCR
+    from assistant_core.ocr import limit_ocr_workers
+    limit_ocr_workers(pool_size)
+
+
+def cpu_executor() -> ProcessPoolExecutor:
+    """
+    Process pool for CPU-bound stages. Workers are spawned rather than forked so they
+    don't inherit the API's torch threads, model weights or open sockets.
+    """
+    global _cpu_executor
+    with _executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ProcessPoolExecutor(max_workers=cpu_workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=init_cpu_worker,
+                                                initargs=(worker_log_queue(), cpu_workers))
+        return _cpu_executor
+
+
+def io_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool for stages that mostly wait on the network or on native code that
+    releases the GIL (embedding, Pinecone, Groq, Tavily).
+    """
+    global _io_executor
+    with _executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io-worker")
+        return _io_executor
+
+
+def _semaphore(stage:str) -> asyncio.Semaphore:
+    if stage not in _semaphores:
+        _semaphores[stage] = asyncio.Semaphore(stage_limits.get(stage, io_workers))
+    return _semaphores[stage]
+
+
+async def run_cpu(stage:str, fn:Callable, *args, **kwargs) -> Any:
+    """
+    Run a picklable function in the process pool, at most `stage_limits[stage]` at a time.
+    """
+    async with _semaphore(stage):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cpu_executor(), partial(fn, *args, **kwargs))
+
+
+async def run_io(stage:str, fn:Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the thread pool, at most `stage_limits[stage]` at a time.
+    """
+    async with _semaphore(stage):
+        loop = asyncio.get_running_loop()
+        #run in a copy of the caller's context so the request id reaches the worker's log lines
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(io_executor(), partial(context.run, fn, *args, **kwargs))
+
+
+async def iterate_io(stage:str, fn:Callable, *args, **kwargs) -> AsyncIterator:
+    """
+    Drive a blocking generator from the thread pool, one item per worker call, so a streamed
+    response counts against `stage_limits[stage]` for as long as it streams.
+    """
+    async with _semaphore(stage):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        iterator = fn(*args, **kwargs)
+        done = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(io_executor(), partial(context.run, next, iterator, done))
+                if item is done:
+                    break
+                yield item
+        finally:
+            #the client may disconnect mid-stream, the generator still gets to clean up
+            await loop.run_in_executor(io_executor(), partial(context.run, iterator.close))
+
+
+def shutdown_workers():
+    """
+    Stop both pools, called when the API shuts down.
+    """
+    global _cpu_executor, _io_executor
+    with _executor_lock:
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(cancel_futures=True)
+            _cpu_executor = None
+        if _io_executor is not None:
+            _io_executor.shutdown(cancel_futures=True)
+            _io_executor = None
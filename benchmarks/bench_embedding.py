@@ -0,0 +1,45 @@
+#benchmark: embedding throughput (chunks/sec) of the torch and ONNX Runtime backends on data/
+#run from the repository root:
+#   python -m benchmarks.bench_embedding --backends torch onnx onnx-int8 --batch-size 64 --threads 4
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+#the benchmark never needs the Pinecone backend
+os.environ.setdefault("VECTOR_BACKEND", "local")
+
+from assistant_core.doc_handler import load_documents_from_directory
+from assistant_core.embedding_vec import build_base_embedding_model, chunk_docs
+
+
+def run(backend:str, texts:list, batch_size:int, threads:int) -> dict:
+    #the raw engines are benchmarked, without the embedding cache in front of them
+    embedder = build_base_embedding_model(backend, batch_size=batch_size, threads=threads)
+    embedder.embed_documents(texts[:batch_size])  #warm-up
+    start = time.perf_counter()
+    vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    return {"backend": backend, "seconds": round(elapsed, 2),
+            "chunks_per_second": round(len(texts) / elapsed, 1), "vectors": vectors}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding throughput of the available backends.")
+    parser.add_argument("--data", default="data", help="folder to chunk and embed")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads, 0 for the runtime default")
+    parser.add_argument("--limit", type=int, default=2000, help="maximum number of chunks to embed")
+    args = parser.parse_args()
+
+    texts = [chunk.page_content for chunk in chunk_docs(load_documents_from_directory(args.data))][:args.limit]
+    results = [run(backend, texts, args.batch_size, args.threads) for backend in args.backends]
+
+    #agreement with the first backend: mean cosine similarity of the same chunk's vectors
+    reference = results[0]["vectors"]
+    for result in results:
+        result["mean_cosine_vs_" + args.backends[0]] = round(float(np.mean(np.sum(result.pop("vectors") * reference, axis=1))), 5)
+    print(json.dumps({"chunks": len(texts), "batch_size": args.batch_size, "threads": args.threads,
+                      "results": results}, indent=2))
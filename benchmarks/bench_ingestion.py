@@ -0,0 +1,42 @@
+#benchmark: serial vs process-pool directory ingestion on the bundled data/ tree
+#run from the repository root:
+#   python -m benchmarks.bench_ingestion --workers 4
+import os
+import json
+import time
+import argparse
+from assistant_core.doc_handler import load_documents_from_directory
+
+
+def fingerprint(docs):
+    """
+    Order-independent summary of a document list, used to check both paths agree.
+    """
+    return sorted((str(d.metadata.get("source")), str(d.metadata.get("subject")), d.page_content) for d in docs)
+
+
+def run(directory:str, workers:int) -> dict:
+    start = time.perf_counter()
+    docs = load_documents_from_directory(directory, workers=workers)
+    elapsed = time.perf_counter() - start
+    return {"workers": workers, "seconds": round(elapsed, 3), "documents": len(docs), "docs": docs}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serial and parallel ingestion of a document folder.")
+    parser.add_argument("--data", default="data", help="folder to ingest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="size of the process pool")
+    args = parser.parse_args()
+
+    serial = run(args.data, workers=1)
+    parallel = run(args.data, workers=args.workers)
+    report = {
+        "data": args.data,
+        "serial_seconds": serial["seconds"],
+        "parallel_seconds": parallel["seconds"],
+        "workers": args.workers,
+        "speedup": round(serial["seconds"] / parallel["seconds"], 2) if parallel["seconds"] else None,
+        "documents": serial["documents"],
+        "identical_output": fingerprint(serial["docs"]) == fingerprint(parallel["docs"]),
+    }
+    print(json.dumps(report, indent=2))
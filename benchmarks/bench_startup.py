@@ -0,0 +1,58 @@
+#benchmark: import time of the API module and time until a fresh server answers /health
+#run from the repository root:
+#   python -m benchmarks.bench_startup --runs 3
+#   WARMUP_ON_STARTUP=0 python -m benchmarks.bench_startup --runs 3   (lazy loading only)
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import httpx
+
+
+def import_seconds() -> float:
+    """
+    Import app.py in a fresh interpreter and return how long the import took.
+    """
+    code = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def ready_seconds(port:int, timeout:float) -> dict:
+    """
+    Start uvicorn and poll /health until it answers; the lifespan warm-up (if enabled) runs before that.
+    """
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                health = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).json()
+                return {"seconds": time.perf_counter() - start, "ready": health.get("ready")}
+            except httpx.HTTPError:
+                time.sleep(0.05)
+        raise TimeoutError(f"The server did not answer within {timeout}s.")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API import time and time-to-ready.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    imports = [import_seconds() for _ in range(args.runs)]
+    starts = [ready_seconds(args.port, args.timeout) for _ in range(args.runs)]
+    print(json.dumps({
+        "warmup_on_startup": os.getenv("WARMUP_ON_STARTUP", "1") == "1",
+        "import_seconds_median": round(statistics.median(imports), 3),
+        "time_to_ready_seconds_median": round(statistics.median(s["seconds"] for s in starts), 3),
+        "models_loaded_when_ready": all(s["ready"] for s in starts),
+    }, indent=2))
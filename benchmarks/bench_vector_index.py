@@ -0,0 +1,97 @@
+#benchmark: recall@5 and query latency of the local IVF index against brute-force search on data/
+#run from the repository root:
+#   python -m benchmarks.bench_vector_index --queries 200 --nprobe 4 8 16
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+#the benchmark builds its own local index, it never needs the Pinecone backend
+os.environ.setdefault("VECTOR_BACKEND", "local")
+
+from assistant_core.doc_handler import load_documents_from_directory
+from assistant_core.embedding_vec import chunk_docs, get_embedding_model
+from assistant_core.local_vector_store import LocalVectorStore
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def timed_search(store:LocalVectorStore, vectors:list, k:int, filters:list, exact:bool):
+    results, latencies = [], []
+    for vector, search_filter in zip(vectors, filters):
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector, k=k, filter=search_filter, exact=exact)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([d.id for d in docs])
+    return results, latencies
+
+
+def summarize(latencies:list) -> dict:
+    return {"p50_ms": round(statistics.median(latencies), 3), "p95_ms": round(percentile(latencies, 95), 3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the local IVF index with brute-force search.")
+    parser.add_argument("--data", default="data", help="folder to index")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16], help="IVF clusters probed per query")
+    parser.add_argument("--min-ivf-size", type=int, default=256,
+                        help="rows needed before IVF is used (the bundled corpus is small)")
+    args = parser.parse_args()
+
+    embedding_model = get_embedding_model()
+    chunks = chunk_docs(load_documents_from_directory(args.data))
+    for n, chunk in enumerate(chunks):
+        chunk.id = str(n)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        store = LocalVectorStore(embedding_model, index_dir, min_ivf_size=args.min_ivf_size)
+        start = time.perf_counter()
+        store.add_documents(chunks)
+        build_seconds = time.perf_counter() - start
+
+        #queries: the opening of random chunks, half of them filtered on the chunk's subject
+        rng = random.Random(0)
+        sample = rng.sample(chunks, min(args.queries, len(chunks)))
+        vectors = embedding_model.embed_documents([c.page_content[:200] for c in sample])
+        filters = [{"subject": c.metadata.get("subject")} if i % 2 else None for i, c in enumerate(sample)]
+
+        truth, exact_latencies = timed_search(store, vectors, args.k, filters, exact=True)
+        report = {
+            "chunks": len(chunks),
+            "queries": len(sample),
+            "build_seconds": round(build_seconds, 2),
+            "ivf_clusters": 0 if store._centroids is None else len(store._centroids),
+            "brute_force": summarize(exact_latencies),
+            "ivf": [],
+        }
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            found, latencies = timed_search(store, vectors, args.k, filters, exact=False)
+            recall = statistics.mean(len(set(f) & set(t)) / max(1, len(t)) for f, t in zip(found, truth))
+            report["ivf"].append({"nprobe": nprobe, f"recall@{args.k}": round(recall, 4), **summarize(latencies)})
+
+        #re-index every chunk (an upsert tombstones the old rows), then reclaim them
+        vectors_path = os.path.join(index_dir, "vectors.f32")
+        store.add_documents(chunks)
+        reindexed_bytes = os.path.getsize(vectors_path)
+        deleted_fraction = store.deleted_fraction()
+        start = time.perf_counter()
+        store.compact()
+        compacted_bytes = os.path.getsize(vectors_path)
+        assert compacted_bytes < reindexed_bytes, "compaction did not shrink the vector file"
+        report["compaction"] = {
+            "deleted_fraction": round(deleted_fraction, 4),
+            "vector_bytes_before": reindexed_bytes,
+            "vector_bytes_after": compacted_bytes,
+            "compact_seconds": round(time.perf_counter() - start, 2),
+        }
+
+    print(json.dumps(report, indent=2))
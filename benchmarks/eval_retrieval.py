@@ -0,0 +1,184 @@
+#offline retrieval evaluation: indexes data/ into temporary local stores and scores labeled questions
+#run from the repository root:
+#   python -m benchmarks.eval_retrieval --k 5 --output results.json
+#   python -m benchmarks.eval_retrieval --modes dense hybrid --filter
+#nothing leaves the machine: local vector store, local BM25 index, a fake chat model and the stub web search
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+os.environ.setdefault("VECTOR_BACKEND", "local")
+os.environ.setdefault("WEB_SEARCH_PROVIDER", "stub")
+#the harness builds its own lexical index, the configured one is not opened
+os.environ.setdefault("LEXICAL_INDEX_ENABLED", "0")
+
+from langchain_core.language_models import FakeListChatModel
+from assistant_core.doc_handler import load_documents_from_directory
+from assistant_core.embedding_vec import build_base_embedding_model, chunk_docs, embedding_backend, get_tokenizer
+from assistant_core.local_vector_store import LocalVectorStore
+from assistant_core.lexical_index import LexicalIndex
+from assistant_core.context_packing import ContextPacker
+from assistant_core.conversation_memory import estimate_tokens
+from assistant_core.retriever_prompt import AssistantPipeline
+
+
+modes = ["dense", "lexical", "hybrid", "hybrid+packing"]
+
+
+class TimedEmbeddings:
+    """
+    Wraps an embedding model and adds up the time spent embedding, so index build time
+    can be split into embedding and writing.
+    """
+
+    def __init__(self, embedding):
+        self.embedding = embedding
+        self.seconds = 0.0
+
+    def embed_documents(self, texts):
+        start = time.perf_counter()
+        try:
+            return self.embedding.embed_documents(texts)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def embed_query(self, text):
+        return self.embedding.embed_query(text)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def doc_sources(doc) -> set:
+    """
+    File names a retrieved chunk comes from (several when near-duplicates were merged).
+    """
+    return {os.path.basename(s) for s in doc.metadata.get("sources") or [doc.metadata.get("source", "")]}
+
+
+def score(docs, relevant:set, k:int) -> dict:
+    found, first_rank = set(), None
+    for rank, doc in enumerate(docs, start=1):
+        hits = doc_sources(doc) & relevant
+        if hits and first_rank is None:
+            first_rank = rank
+        if rank <= k:
+            found |= hits
+    return {"recall": len(found) / len(relevant), "rr": 1.0 / first_rank if first_rank else 0.0}
+
+
+def build_pipeline(mode:str, embedding, store, lexical, k:int, max_tokens:int) -> AssistantPipeline:
+    packer = (ContextPacker(embedding, max_tokens=max_tokens, tokenizer=get_tokenizer())
+              if mode == "hybrid+packing" else None)
+    pipeline = AssistantPipeline(FakeListChatModel(responses=[""]), store, lexical if mode != "dense" else None,
+                                 k=k, packer=packer)
+    if mode == "lexical":
+        #BM25 only: replace the corpus retrievers before they are first used
+        pipeline.base_retrievers = lambda course=None: [(lexical.as_retriever(
+            k=k, filter={"subject": course} if course else None), 1.0)]
+    return pipeline
+
+
+def evaluate(pipeline:AssistantPipeline, questions:list, k:int, use_filter:bool) -> dict:
+    scores, latencies, context_tokens = [], [], []
+    for item in questions:
+        course = item.get("subject") if use_filter else None
+        start = time.perf_counter()
+        docs = pipeline.search(item["question"], course)
+        latencies.append((time.perf_counter() - start) * 1000)
+        scores.append(score(docs, {os.path.basename(r) for r in item["relevant"]}, k))
+        context_tokens.append(sum(estimate_tokens(d.page_content) for d in docs))
+    return {
+        f"recall@{k}": round(statistics.mean(s["recall"] for s in scores), 4),
+        "mrr": round(statistics.mean(s["rr"] for s in scores), 4),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "mean_context_tokens": round(statistics.mean(context_tokens), 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline recall/MRR/latency evaluation of retrieval on the course corpus.")
+    parser.add_argument("--data", default="data", help="folder to index")
+    parser.add_argument("--questions", default=os.path.join(os.path.dirname(__file__), "eval_questions.json"),
+                        help="JSON list of {question, subject, relevant: [file names]}")
+    parser.add_argument("--k", type=int, default=5, help="documents retrieved per retriever and cut-off for recall")
+    parser.add_argument("--modes", nargs="+", default=modes, choices=modes)
+    parser.add_argument("--filter", action="store_true", help="restrict each question to its labeled subject")
+    parser.add_argument("--backend", default=embedding_backend, help="embedding backend: torch, onnx or onnx-int8")
+    parser.add_argument("--context-tokens", type=int, default=2000, help="context budget of the packing mode")
+    parser.add_argument("--min-ivf-size", type=int, default=2048, help="rows needed before the local store uses IVF")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    #ingestion, stage by stage
+    start = time.perf_counter()
+    docs = load_documents_from_directory(args.data)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = chunk_docs(docs)
+    chunk_seconds = time.perf_counter() - start
+    for n, chunk in enumerate(chunks):
+        chunk.id = str(n)
+
+    embedding = TimedEmbeddings(build_base_embedding_model(args.backend))
+    embedding.embed_documents(["warm up"])
+    embedding.seconds = 0.0
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = LocalVectorStore(embedding, os.path.join(work_dir, "vectors"), min_ivf_size=args.min_ivf_size)
+        start = time.perf_counter()
+        store.add_documents(chunks)
+        vector_seconds = time.perf_counter() - start
+
+        lexical = LexicalIndex(os.path.join(work_dir, "lexical"))
+        start = time.perf_counter()
+        lexical.add_documents(chunks)
+        lexical.build()
+        lexical_seconds = time.perf_counter() - start
+
+        total_chars = sum(len(c.page_content) for c in chunks)
+        report = {
+            "commit": git_commit(),
+            "embedding_backend": args.backend,
+            "k": args.k,
+            "filtered": args.filter,
+            "questions": len(questions),
+            "corpus": {"pages": len(docs), "chunks": len(chunks), "characters": total_chars},
+            "ingestion": {
+                "load": {"seconds": round(load_seconds, 3), "pages_per_second": round(len(docs) / load_seconds, 1)},
+                "chunk": {"seconds": round(chunk_seconds, 3), "chunks_per_second": round(len(chunks) / chunk_seconds, 1)},
+                "embed": {"seconds": round(embedding.seconds, 3),
+                          "chunks_per_second": round(len(chunks) / embedding.seconds, 1)},
+                "vector_write": {"seconds": round(vector_seconds - embedding.seconds, 3)},
+                "lexical_build": {"seconds": round(lexical_seconds, 3)},
+            },
+            "index_build_seconds": round(vector_seconds + lexical_seconds, 3),
+            "modes": {},
+        }
+        for mode in args.modes:
+            pipeline = build_pipeline(mode, embedding, store, lexical, args.k, args.context_tokens)
+            pipeline.search("warm up")
+            report["modes"][mode] = evaluate(pipeline, questions, args.k, args.filter)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
@@ -0,0 +1,103 @@
+#load test: /health latency while uploads are in flight
+#start the API first (uvicorn app:app --host 127.0.0.1 --port 5000), then run from the repository root:
+#   python -m benchmarks.load_test_health --file "data/finance/FIN PQ 2.pdf" --uploads 8
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def probe_health(client:httpx.AsyncClient, url:str, stop:asyncio.Event, interval:float) -> list:
+    """
+    Hit /health every `interval` seconds until `stop` is set and return the latencies in ms.
+    """
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(f"{url}/health")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+#upload job states after which nothing is parsed or embedded any more
+finished_statuses = ("done", "partial", "failed")
+
+
+async def upload(client:httpx.AsyncClient, url:str, path:str, poll_interval:float) -> dict:
+    """
+    Upload a file and wait until its background job has parsed and embedded it, polling
+    /upload/{session_id}/status. Returns the time to the 202 response, the time until the
+    job finished and its final status.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    start = time.perf_counter()
+    response = await client.post(f"{url}/upload", files=[("files", (os.path.basename(path), content))])
+    response.raise_for_status()
+    accepted = time.perf_counter() - start
+    session_id = response.json()["session_id"]
+    while True:
+        status = await client.get(f"{url}/upload/{session_id}/status")
+        status.raise_for_status()
+        job = status.json()
+        if job["status"] in finished_statuses:
+            break
+        await asyncio.sleep(poll_interval)
+    return {"accepted_seconds": accepted, "processed_seconds": time.perf_counter() - start, "status": job["status"]}
+
+
+def summarize(latencies:list) -> dict:
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def main(url:str, path:str, uploads:int, interval:float, baseline_seconds:float):
+    async with httpx.AsyncClient(timeout=None) as client:
+        #baseline: /health with nothing else going on
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, url, stop, interval))
+        await asyncio.sleep(baseline_seconds)
+        stop.set()
+        idle = await probe
+
+        #same probe while `uploads` uploads are parsed, OCR'd and embedded in the background
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, url, stop, interval))
+        results = await asyncio.gather(*[upload(client, url, path, interval) for _ in range(uploads)])
+        stop.set()
+        loaded = await probe
+
+    print(json.dumps({
+        "uploads": uploads,
+        "file": path,
+        "upload_accepted_seconds_max": round(max(r["accepted_seconds"] for r in results), 2),
+        "upload_processed_seconds_max": round(max(r["processed_seconds"] for r in results), 2),
+        "upload_statuses": {status: sum(r["status"] == status for r in results) for status in finished_statuses},
+        "health_idle": summarize(idle),
+        "health_during_uploads": summarize(loaded),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /health latency while uploads are being processed.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--file", required=True, help="document to upload")
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between /health probes and status polls")
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.file, args.uploads, args.interval, args.baseline_seconds))
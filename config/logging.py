@@ -1,10 +1,180 @@
 import logging
+import logging.handlers
 import pathlib
+import atexit
+import json
+import queue
+import multiprocessing
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from pathlib import Path
 import os 
 
 cwd = Path.cwd()
 
+#log output settings: "json" or "text" lines, size-based rotation and the longest message kept
+log_format = os.getenv("LOG_FORMAT", "json").lower()
+log_max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+log_backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+log_max_field_chars = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+
+#id of the request being served, set by the API middleware and added to every log line
+request_id = ContextVar("request_id", default="-")
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds the current request id to each log record as `request_id`.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+def truncate(text: str, limit: int = log_max_field_chars) -> str:
+    """
+    Cut a long log field (e.g. a whole LLM response) to `limit` characters, saying how much was dropped.
+    """
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class TruncateFilter(logging.Filter):
+    """
+    Merges the message arguments and truncates the result, before the record is queued or written.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, request id and message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }, ensure_ascii=False)
+
+
+class LoggerRouter(logging.Handler):
+    """
+    Handler of the listener thread that sends each record to the file of the logger that wrote it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+
+    def emit(self, record: logging.LogRecord):
+        handler = self.handlers.get(record.name)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+
+
+#every logger only enqueues its records; a single background thread of the main process writes
+#them to disk. Other processes never rotate the files: worker pools forward their records to the
+#main process (worker_log_queue / init_worker_logging), any other child appends to the files directly.
+main_process = multiprocessing.parent_process() is None
+log_queue = queue.SimpleQueue()
+log_router = LoggerRouter()
+log_listener = logging.handlers.QueueListener(log_queue, log_router)
+_listeners = []
+if main_process:
+    log_listener.start()
+    _listeners.append(log_listener)
+
+#log file and level of every logger set up in this process
+_log_files = {}
+_worker_queue = None
+
+
+def stop_logging():
+    """
+    Write out what is still queued and stop the listener threads; safe to call more than once.
+    """
+    while _listeners:
+        _listeners.pop().stop()
+
+
+#flush what is still queued when the process exits
+atexit.register(stop_logging)
+
+
+def _formatter() -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s- %(levelname)s - [%(request_id)s] %(message)s')
+
+
+def _attach(logger_name: str, handler: logging.Handler):
+    """
+    Make `handler` the only handler of a logger set up here, with the request id and truncation filters.
+    """
+    logger = logging.getLogger(logger_name)
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    #the request id lives in a contextvar, so it is read here on the caller's side, before the record is queued
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(TruncateFilter())
+    logger.addHandler(handler)
+
+
+def _append_handler(log_file: str, log_level: int) -> logging.Handler:
+    #plain appends are safe from several processes, only the main process rotates
+    handler = logging.FileHandler(log_file, encoding="utf-8")
+    handler.setLevel(log_level)
+    handler.setFormatter(_formatter())
+    return handler
+
+
+def _after_fork_in_child():
+    """
+    A forked child inherits the queue but not the listener thread, so it writes directly instead.
+    """
+    global main_process
+    main_process = False
+    _listeners.clear()
+    for logger_name, (log_file, log_level) in _log_files.items():
+        _attach(logger_name, _append_handler(log_file, log_level))
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def worker_log_queue():
+    """
+    Queue through which worker processes send their records to the main process's files,
+    created on first use. Pass it to a process pool's initializer:
+    ProcessPoolExecutor(initializer=init_worker_logging, initargs=(worker_log_queue(),)).
+    """
+    global _worker_queue
+    if _worker_queue is None:
+        _worker_queue = multiprocessing.get_context("spawn").Queue()
+        listener = logging.handlers.QueueListener(_worker_queue, log_router)
+        listener.start()
+        _listeners.append(listener)
+    return _worker_queue
+
+
+def init_worker_logging(worker_queue):
+    """
+    Process pool initializer: send every record of this worker to the main process.
+    """
+    for logger_name in _log_files:
+        _attach(logger_name, logging.handlers.QueueHandler(worker_queue))
+
+
 def setup_logger(
         logger_name: str,
         log_file: str,
@@ -12,7 +182,8 @@ def setup_logger(
 ) -> logging.Logger:
     """
     This function allows the system to create and write log data
-    of the system's operations.
+    of the system's operations. The logger only puts records on the shared
+    queue; the background listener writes them to a size-rotated file.
 
     Args:
         logger_name (str): the name of the log file to create
@@ -22,12 +193,18 @@ def setup_logger(
 
     logger = logging.getLogger(logger_name)
     logger.setLevel(log_level)
+    _log_files[logger_name] = (log_file, log_level)
+
+    if not main_process:
+        _attach(logger_name, _append_handler(log_file, log_level))
+        return logger
 
-    file_handler = logging.FileHandler(log_file)
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=log_max_bytes,
+                                                        backupCount=log_backup_count, encoding="utf-8")
     file_handler.setLevel(log_level)
-    format = logging.Formatter('%(asctime)s - %(name)s- %(levelname)s - %(message)s')
-    file_handler.setFormatter(format)
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(_formatter())
+    log_router.handlers[logger_name] = file_handler
+    _attach(logger_name, logging.handlers.QueueHandler(log_queue))
 
     return logger
 
@@ -54,7 +231,8 @@ log_files_to_create = [
     "embedding_vec.log",
     "fastapi_app.log",
     "main_app.log",
-    "retriever_prompt.log"]
+    "retriever_prompt.log",
+    "indexer.log"]
 
 for log_file in log_files_to_create:
     create_folder_and_log_file(folder_name, log_file)
@@ -67,4 +245,5 @@ fastapi_app_logger = setup_logger("fastapi_app", os.path.join(folder_name, "fast
 embedding_vec_logger = setup_logger("embedding_vec", os.path.join(folder_name, "embedding_vec.log"))
 # Set up the logger for the main application
 main_app_logger = setup_logger("main_app", os.path.join(folder_name, "main_app.log"))
-retriever_prompt_logger = setup_logger("retriever_prompt", os.path.join(folder_name, "retriever_prompt.log"))
\ No newline at end of file
+retriever_prompt_logger = setup_logger("retriever_prompt", os.path.join(folder_name, "retriever_prompt.log"))
+indexer_logger = setup_logger("indexer", os.path.join(folder_name, "indexer.log"))
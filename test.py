@@ -1,11 +1,14 @@
 import streamlit as st 
 import requests
+import json
+import uuid
 from assistant_core.voice_input import transcibe_audio, text_to_speech
 from config.logging import main_app_logger
 
 #backend urls
 query_url = "http://127.0.0.1:5000/query"
 upload_url = "http://127.0.0.1:5000/upload"
+upload_status_url = "http://127.0.0.1:5000/upload/{session_id}/status"
 
 st.set_page_config(
     page_title="Accounting Assistant",
@@ -95,11 +98,25 @@ st.write("*Your AI-powered tutor for Financial Accounting & IFRS Standards*")
 
 
 
+def stream_tokens(response):
+    """
+    Yield the answer tokens of a server-sent event stream from /query.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data: "):
+            token = json.loads(line[len("data: "):]).get("token")
+            if token:
+                yield token
+
+
 #session state 
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "session_id" not in st.session_state:
     st.session_state.session_id = None
+#the server keeps the conversation history under this id, only new questions are sent
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = str(uuid.uuid4())
 
 #document upload section
 st.sidebar.subheader("✨ Upload your Accounting Documents")
@@ -112,11 +129,11 @@ if uploaded_files and st.sidebar.button("Upload"):
         files = [("files", (file.name, file, file.type)) for file in uploaded_files]
         response = requests.post(upload_url, files = files)
 
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             result = response.json()
             st.session_state.session_id = result.get("session_id")
             main_app_logger.info(f"Files uploaded successfully. Session ID: {st.session_state.session_id}")
-            st.sidebar.success(f"Successfully uploaded {len(uploaded_files)} file(s).")
+            st.sidebar.success(f"Uploaded {len(uploaded_files)} file(s), processing in the background.")
         else:
             main_app_logger.error(f"Failed to upload files. Status code: {response.status_code}, Response: {response.text}")
             st.sidebar.error("Failed to upload files. Please try again.")
@@ -124,6 +141,23 @@ if uploaded_files and st.sidebar.button("Upload"):
         main_app_logger.error(f"Exception during file upload: {e}")
         st.sidebar.error("An error occurred during file upload. Please try again.")
 
+#upload progress, the documents that are ready can already be used in questions
+if st.session_state.session_id:
+    try:
+        status = requests.get(upload_status_url.format(session_id=st.session_state.session_id))
+        if status.status_code == 200:
+            job = status.json()
+            if job["status"] in ("queued", "processing"):
+                st.sidebar.progress(job["files_ready"] / max(job["files_total"], 1),
+                                    text=f"Processing uploads: {job['files_ready']}/{job['files_total']} ready")
+                if st.sidebar.button("Refresh upload status"):
+                    st.rerun()
+            for f in job["files"]:
+                if f["status"] == "failed":
+                    st.sidebar.warning(f"{f['filename']}: {f['error']}")
+    except Exception as e:
+        main_app_logger.error(f"Exception while checking upload status: {e}")
+
 # Sidebar options
 voice_input = st.sidebar.checkbox("🎙 Speak my query")
 voice_output = st.sidebar.checkbox("🔊 Read answer aloud")
@@ -166,17 +200,18 @@ if query:
         payload = {
             "query": query,
             "session_id": st.session_state.session_id,
-            "history": st.session_state.chat_history,
+            "conversation_id": st.session_state.conversation_id,
+            "stream": True,
         }
-        response = requests.post(query_url, json=payload, verify=False)
+        response = requests.post(query_url, json=payload, verify=False, stream=True)
 
         if response.status_code == 200:
-            answer = response.text
+            # Render answer tokens as the server streams them (server-sent events)
+            with st.chat_message("assistant"):
+                answer = st.write_stream(stream_tokens(response))
 
             # Add assistant response to chat history
             st.session_state.chat_history.append(("assistant", answer))
-            with st.chat_message("assistant"):
-                st.markdown(answer)
 
             if voice_output:
                 text_to_speech(answer)